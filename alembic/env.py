@@ -0,0 +1,75 @@
+from logging.config import fileConfig
+import asyncio
+
+from alembic import context
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from database import Base, DATABASE_URL, BASELINE_REVISION, engine_options
+import models  # noqa: F401 - регистрируем модели в Base.metadata
+
+config = context.config
+target_metadata = Base.metadata
+
+
+def include_name(name, type_, parent_names):
+    # Полнотекстовый индекс чата (миграция 0005) создается SQL-командами и в моделях не описан
+    if type_ == "table":
+        return not name.startswith("messages_fts")
+    return True
+
+
+def run_migrations_offline():
+    """Генерация SQL без подключения к БД (alembic upgrade head --sql)"""
+    context.configure(
+        url=DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        render_as_batch=DATABASE_URL.startswith("sqlite"),
+        include_name=include_name,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection):
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        # SQLite не умеет большинство ALTER TABLE - alembic пересоздает таблицу
+        render_as_batch=connection.dialect.name == "sqlite",
+        include_name=include_name,
+    )
+    with context.begin_transaction():
+        # База создана до перехода на миграции (create_all) - помечаем исходной ревизией
+        migration_context = context.get_context()
+        if migration_context.get_current_revision() is None and inspect(connection).has_table("users"):
+            migration_context.stamp(context.script, BASELINE_REVISION)
+        context.run_migrations()
+
+
+async def run_async_migrations():
+    engine = create_async_engine(DATABASE_URL, **engine_options())
+    async with engine.begin() as connection:
+        await connection.run_sync(do_run_migrations)
+    await engine.dispose()
+
+
+def run_migrations_online():
+    # При запуске приложения соединение передается из database.init_db
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        do_run_migrations(connection)
+        return
+
+    # Запуск из командной строки: alembic upgrade head
+    if config.config_file_name is not None:
+        fileConfig(config.config_file_name)
+    asyncio.run(run_async_migrations())
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
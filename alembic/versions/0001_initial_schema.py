@@ -0,0 +1,84 @@
+"""Исходная схема: пользователи, задачи, сессии, сообщения чата
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 00:00:00
+
+Совпадает с тем, что раньше создавал Base.metadata.create_all. Базы,
+созданные до перехода на миграции, помечаются этой ревизией при запуске.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(length=100), nullable=False),
+        sa.Column('email', sa.String(length=255), nullable=False),
+        sa.Column('password_hash', sa.String(length=255), nullable=False),
+        sa.Column('role', sa.String(length=20), nullable=False),
+        sa.Column('avatar', sa.String(length=500), nullable=True),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_users_id', 'users', ['id'])
+    op.create_index('ix_users_username', 'users', ['username'], unique=True)
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+
+    op.create_table(
+        'tasks',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=255), nullable=False),
+        sa.Column('description', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('created_by_id', sa.Integer(), nullable=False),
+        sa.Column('assigned_to_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['assigned_to_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['created_by_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_tasks_id', 'tasks', ['id'])
+
+    op.create_table(
+        'sessions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('session_id', sa.String(length=255), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_sessions_id', 'sessions', ['id'])
+    op.create_index('ix_sessions_session_id', 'sessions', ['session_id'], unique=True)
+
+    op.create_table(
+        'messages',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=True),
+        sa.Column('message_type', sa.String(length=20), nullable=False),
+        sa.Column('file_path', sa.String(length=500), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_messages_id', 'messages', ['id'])
+
+
+def downgrade() -> None:
+    op.drop_table('messages')
+    op.drop_table('sessions')
+    op.drop_table('tasks')
+    op.drop_table('users')
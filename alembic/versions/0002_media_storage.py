@@ -0,0 +1,46 @@
+"""Миниатюры сообщений и хранилище файлов по содержимому
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:00:01
+
+До перехода на миграции эти изменения могли быть уже внесены при запуске
+приложения, поэтому таблица и колонка создаются только если их нет.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+
+    message_columns = {column['name'] for column in inspector.get_columns('messages')}
+    if 'thumbnail_path' not in message_columns:
+        op.add_column('messages', sa.Column('thumbnail_path', sa.String(length=500), nullable=True))
+
+    if not inspector.has_table('media_blobs'):
+        op.create_table(
+            'media_blobs',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('path', sa.String(length=500), nullable=False),
+            sa.Column('sha256', sa.String(length=64), nullable=False),
+            sa.Column('size', sa.Integer(), nullable=False),
+            sa.Column('ref_count', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_media_blobs_id', 'media_blobs', ['id'])
+        op.create_index('ix_media_blobs_path', 'media_blobs', ['path'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_table('media_blobs')
+    with op.batch_alter_table('messages') as batch_op:
+        batch_op.drop_column('thumbnail_path')
@@ -0,0 +1,36 @@
+"""Индексы для частых запросов: задачи, сессии, сообщения, роли
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 00:00:02
+
+Проверка планов запросов: python check_query_plans.py
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_users_role_id', 'users', ['role', 'id'])
+    op.create_index('ix_tasks_created_by_id_id', 'tasks', ['created_by_id', 'id'])
+    op.create_index('ix_tasks_assigned_to_id_id', 'tasks', ['assigned_to_id', 'id'])
+    op.create_index('ix_sessions_user_id_expires_at', 'sessions', ['user_id', 'expires_at'])
+    op.create_index('ix_sessions_expires_at', 'sessions', ['expires_at'])
+    op.create_index('ix_messages_user_id_id', 'messages', ['user_id', 'id'])
+    op.create_index('ix_messages_created_at', 'messages', ['created_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_created_at', table_name='messages')
+    op.drop_index('ix_messages_user_id_id', table_name='messages')
+    op.drop_index('ix_sessions_expires_at', table_name='sessions')
+    op.drop_index('ix_sessions_user_id_expires_at', table_name='sessions')
+    op.drop_index('ix_tasks_assigned_to_id_id', table_name='tasks')
+    op.drop_index('ix_tasks_created_by_id_id', table_name='tasks')
+    op.drop_index('ix_users_role_id', table_name='users')
@@ -0,0 +1,33 @@
+"""Колонка updated_at у пользователей, задач и сообщений (ETag и Last-Modified)
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 00:00:03
+
+Для существующих строк updated_at заполняется значением created_at.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+TABLES = ('users', 'tasks', 'messages')
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.execute(f'UPDATE {table} SET updated_at = created_at')
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade() -> None:
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('updated_at')
@@ -0,0 +1,78 @@
+"""Полнотекстовый поиск по сообщениям чата
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 00:00:04
+
+SQLite: виртуальная таблица FTS5 messages_fts поверх messages (external content)
+и триггеры, которые обновляют ее при вставке, изменении и удалении сообщений -
+так индекс не зависит от того, каким путем сообщение попало в БД.
+Для существующих сообщений индекс строится сразу ('rebuild').
+
+PostgreSQL: GIN-индекс по выражению to_tsvector; выражение должно совпадать
+с chat_search.PG_VECTOR, иначе планировщик индекс не использует.
+
+Внимание: batch_alter_table('messages') в SQLite пересоздает таблицу и удаляет
+триггеры - после такой миграции их нужно создать заново.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+SQLITE_TRIGGERS = {
+    'messages_fts_insert': """
+        CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+        END
+    """,
+    'messages_fts_delete': """
+        CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+    """,
+    'messages_fts_update': """
+        CREATE TRIGGER messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+        END
+    """,
+}
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute(
+            "CREATE INDEX ix_messages_content_tsv ON messages "
+            "USING gin (to_tsvector('russian', coalesce(content, '')))"
+        )
+    elif dialect == 'sqlite':
+        try:
+            op.execute(
+                "CREATE VIRTUAL TABLE messages_fts USING fts5("
+                "content, content='messages', content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+        except sa.exc.OperationalError as e:
+            # SQLite собран без FTS5 - поиск будет работать через LIKE
+            print(f"FTS5 недоступен, полнотекстовый индекс чата не создан: {e}")
+            return
+        for statement in SQLITE_TRIGGERS.values():
+            op.execute(statement)
+        op.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_messages_content_tsv")
+    elif dialect == 'sqlite':
+        for name in SQLITE_TRIGGERS:
+            op.execute(f"DROP TRIGGER IF EXISTS {name}")
+        op.execute("DROP TABLE IF EXISTS messages_fts")
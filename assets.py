@@ -0,0 +1,171 @@
+from typing import Dict, NamedTuple
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # Без пакета Brotli отдаем только gzip
+    brotli = None
+
+STATIC_DIR = "static"
+STATIC_URL = "/static"
+# Файлы с хэшем в имени никогда не меняются - кэшируем в браузере на год
+ASSET_CACHE_MAX_AGE = 365 * 24 * 3600
+# Сжимаем только текстовые файлы и только если это заметно уменьшает размер
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+COMPRESS_MIN_SIZE = 1024
+ASSET_HASH_LENGTH = 12
+
+
+class Asset(NamedTuple):
+    name: str          # Путь относительно static: "script.js"
+    hashed_name: str   # "script.1a2b3c4d5e6f.js"
+    digest: str
+    media_type: str
+    variants: Dict[str, bytes]  # кодировка ("identity", "br", "gzip") -> тело
+
+
+def hashed_filename(name: str, digest: str) -> str:
+    root, ext = os.path.splitext(name)
+    return f"{root}.{digest}{ext}"
+
+
+def compress_variants(content: bytes, media_type: str) -> Dict[str, bytes]:
+    variants = {"identity": content}
+    if len(content) < COMPRESS_MIN_SIZE or not media_type.startswith(COMPRESSIBLE_TYPES):
+        return variants
+    if brotli is not None:
+        compressed = brotli.compress(content, quality=11)
+        if len(compressed) < len(content) * 0.9:
+            variants["br"] = compressed
+    # mtime=0 - одинаковый результат во всех воркерах
+    compressed = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(compressed) < len(content) * 0.9:
+        variants["gzip"] = compressed
+    return variants
+
+
+class AssetManifest:
+    """Манифест статических файлов: хэш содержимого и заранее сжатые варианты.
+
+    Строится один раз при запуске; файлы небольшие, поэтому держим их в памяти
+    вместе со сжатыми копиями и не читаем диск на каждый запрос.
+    """
+
+    def __init__(self, directory: str = STATIC_DIR):
+        self.directory = directory
+        self.assets: Dict[str, Asset] = {}
+        self._by_hashed_name: Dict[str, Asset] = {}
+
+    def build(self):
+        assets = {}
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    content = f.read()
+                digest = hashlib.sha256(content).hexdigest()[:ASSET_HASH_LENGTH]
+                media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                if media_type.startswith("text/") or media_type == "application/javascript":
+                    media_type += "; charset=utf-8"
+                assets[name] = Asset(name, hashed_filename(name, digest), digest, media_type,
+                                     compress_variants(content, media_type))
+        self.assets = assets
+        self._by_hashed_name = {asset.hashed_name: asset for asset in assets.values()}
+
+    def url(self, name: str) -> str:
+        asset = self.assets.get(name)
+        return f"{STATIC_URL}/{asset.hashed_name if asset else name}"
+
+    def lookup(self, path: str):
+        """(asset, неизменяемый ли URL) или (None, False)"""
+        asset = self._by_hashed_name.get(path)
+        if asset is not None:
+            return asset, True
+        return self.assets.get(path), False
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self.assets),
+            "bytes": sum(len(asset.variants["identity"]) for asset in self.assets.values()),
+            "compressed": {
+                encoding: sum(len(asset.variants[encoding]) for asset in self.assets.values() if encoding in asset.variants)
+                for encoding in ("br", "gzip")
+            },
+        }
+
+
+asset_manifest = AssetManifest()
+
+
+# Для шаблонов: {{ asset_url('style.css') }} -> /static/style.1a2b3c4d5e6f.css
+def asset_url(name: str) -> str:
+    return asset_manifest.url(name)
+
+
+def choose_encoding(accept_encoding: str, available) -> str:
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, *params = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(coding.lower())
+    for encoding in ("br", "gzip"):
+        if encoding in available and (encoding in accepted or "*" in accepted):
+            return encoding
+    return "identity"
+
+
+class AssetStaticFiles(StaticFiles):
+    """Раздача статики из манифеста.
+
+    /static/script.<хэш>.js - неизменяемый URL, кэш на год с immutable.
+    /static/script.js - старый URL, браузер каждый раз сверяет ETag.
+    Файлы, которых нет в манифесте (добавлены после запуска), отдаются как обычно.
+    """
+
+    def __init__(self, *args, manifest: AssetManifest = asset_manifest, max_age: int = ASSET_CACHE_MAX_AGE, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.manifest = manifest
+        self.immutable_cache_control = f"public, max-age={max_age}, immutable"
+
+    async def get_response(self, path: str, scope) -> Response:
+        asset, immutable = self.manifest.lookup(path.replace(os.sep, "/"))
+        if asset is None or scope["method"] not in ("GET", "HEAD"):
+            return await super().get_response(path, scope)
+
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""), asset.variants)
+        body = asset.variants[encoding]
+        etag = f'"{asset.digest}-{encoding}"'
+        headers = {
+            "ETag": etag,
+            "Vary": "Accept-Encoding",
+            "Cache-Control": self.immutable_cache_control if immutable else "no-cache",
+        }
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+
+        if_none_match = request_headers.get("if-none-match", "")
+        if etag in (tag.strip() for tag in if_none_match.split(",")):
+            return Response(status_code=304, headers=headers)
+
+        headers["Content-Length"] = str(len(body))
+        return Response(
+            content=body if scope["method"] == "GET" else b"",
+            media_type=asset.media_type,
+            headers=headers,
+        )
@@ -0,0 +1,112 @@
+"""Пропускная способность /api/login в зависимости от параметров хэширования паролей.
+
+Для каждого набора параметров запускается отдельный процесс приложения на
+временной SQLite-базе, регистрируется пользователь и выполняется
+LOGINS входов при CONCURRENCY одновременных запросах.
+
+Запуск из корня проекта: python benchmarks/password_hashing.py
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOGINS = int(os.getenv("BENCH_LOGINS", "40"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "8"))
+
+# Наборы параметров: от дешевых к рекомендуемым по умолчанию
+CONFIGS = [
+    {"PASSWORD_HASH_ALGORITHM": "scrypt", "SCRYPT_N": str(2 ** 12)},
+    {"PASSWORD_HASH_ALGORITHM": "scrypt", "SCRYPT_N": str(2 ** 14)},
+    {"PASSWORD_HASH_ALGORITHM": "scrypt", "SCRYPT_N": str(2 ** 15)},
+    {"PASSWORD_HASH_ALGORITHM": "pbkdf2_sha256", "PBKDF2_ITERATIONS": "100000"},
+    {"PASSWORD_HASH_ALGORITHM": "pbkdf2_sha256", "PBKDF2_ITERATIONS": "600000"},
+]
+WORKERS = [1, 2, 4]
+
+
+async def run_child():
+    import httpx
+    from main import app
+
+    await app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            credentials = {"email": "bench@valve.com", "password": "bench-password"}
+            response = await client.post("/api/register", json={
+                **credentials, "username": "bench", "role": "employee"
+            })
+            response.raise_for_status()
+
+            # Пока идут входы, цикл событий должен отвечать: меряем задержку пинга
+            stalls = []
+
+            async def ping():
+                while True:
+                    started = time.perf_counter()
+                    await asyncio.sleep(0.005)
+                    stalls.append(time.perf_counter() - started - 0.005)
+
+            semaphore = asyncio.Semaphore(CONCURRENCY)
+            latencies = []
+
+            async def login():
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.post("/api/login", json=credentials)
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - started)
+
+            pinger = asyncio.create_task(ping())
+            started = time.perf_counter()
+            await asyncio.gather(*(login() for _ in range(LOGINS)))
+            elapsed = time.perf_counter() - started
+            pinger.cancel()
+    finally:
+        await app.router.shutdown()
+
+    latencies.sort()
+    print(json.dumps({
+        "logins_per_sec": round(LOGINS / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        "max_loop_stall_ms": round(max(stalls, default=0) * 1000, 1),
+    }))
+
+
+def run_parent():
+    results = []
+    print(f"{'параметры':<62} {'потоки':>6} {'входов/с':>9} {'p50, мс':>8} {'p95, мс':>8} {'стоп цикла, мс':>15}")
+    for config in CONFIGS:
+        for workers in WORKERS:
+            with tempfile.TemporaryDirectory() as tmp:
+                env = {
+                    **os.environ, **config,
+                    "PASSWORD_HASH_WORKERS": str(workers),
+                    "DATABASE_URL": f"sqlite+aiosqlite:///{tmp}/bench.db",
+                    "DB_MIGRATION_LOCK": f"{tmp}/migrations.lock",
+                    "CHAT_BUFFER_SIZE": "0",
+                }
+                output = subprocess.run(
+                    [sys.executable, __file__, "--child"],
+                    cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+                ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            params = ", ".join(f"{key}={value}" for key, value in config.items())
+            results.append({"params": config, "workers": workers, **result})
+            print(f"{params:<62} {workers:>6} {result['logins_per_sec']:>9} {result['p50_ms']:>8} "
+                  f"{result['p95_ms']:>8} {result['max_loop_stall_ms']:>15}")
+    return results
+
+
+if __name__ == "__main__":
+    if "--child" in sys.argv:
+        sys.path.insert(0, ROOT)
+        asyncio.run(run_child())
+    else:
+        run_parent()
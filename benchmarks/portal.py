@@ -0,0 +1,420 @@
+"""Нагрузочные сценарии портала: пропускная способность и задержки основных эндпоинтов.
+
+Приложение работает в этом же процессе (httpx.ASGITransport, WebSocket - напрямую
+через ASGI), база - временная SQLite, сеть не нужна. Перед замерами в базу
+добавляются BENCH_USERS пользователей, BENCH_TASKS задач и BENCH_MESSAGES сообщений.
+
+Сценарии:
+    login    - одновременные входы (POST /api/login)
+    profile  - рендер личного кабинета (GET /profile)
+    tasks    - чтение задач (GET /api/tasks)
+    chat     - POST /api/chat/message при BENCH_LISTENERS подключенных к /ws/chat
+    uploads  - одновременные загрузки файлов в чат
+
+Результат - JSON (throughput, p50/p99 в мс, SQL-запросов на запрос), чтобы
+сравнивать коммиты между собой.
+
+Запуск из корня проекта:
+    python benchmarks/portal.py
+    python benchmarks/portal.py --only tasks,chat --out before.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("login", "profile", "tasks", "chat", "uploads")
+
+USERS = int(os.getenv("BENCH_USERS", "200"))
+TASKS = int(os.getenv("BENCH_TASKS", "5000"))
+MESSAGES = int(os.getenv("BENCH_MESSAGES", "10000"))
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "300"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "16"))
+LOGINS = int(os.getenv("BENCH_LOGINS", "100"))
+LISTENERS = int(os.getenv("BENCH_LISTENERS", "100"))
+CHAT_MESSAGES = int(os.getenv("BENCH_CHAT_MESSAGES", "200"))
+UPLOADS = int(os.getenv("BENCH_UPLOADS", "50"))
+UPLOAD_KB = int(os.getenv("BENCH_UPLOAD_KB", "512"))
+PASSWORD = "bench-password"
+# Сколько ждать доставки сообщения всем слушателям, прежде чем считать его потерянным
+DELIVERY_TIMEOUT = 30
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def summarize(latencies, elapsed: float, errors: int = 0, **extra) -> dict:
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        **extra,
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def prepare_workdir(tmp: str):
+    """Рабочая папка приложения: код и шаблоны из проекта, база и uploads - временные"""
+    for name in ("templates", "static", "alembic"):
+        os.symlink(os.path.join(ROOT, name), os.path.join(tmp, name))
+    os.environ.update({
+        "DATABASE_URL": f"sqlite+aiosqlite:///{tmp}/bench.db",
+        "DB_MIGRATION_LOCK": f"{tmp}/migrations.lock",
+        "BROADCAST_SOCKET": f"{tmp}/broadcast.sock",
+    })
+    os.chdir(tmp)
+    sys.path.insert(0, ROOT)
+
+
+async def run_concurrently(count: int, concurrency: int, request):
+    """count вызовов request(i) не более чем по concurrency одновременно: (задержки, ошибки, время)"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await request(i)
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return latencies, errors, time.perf_counter() - started
+
+
+class AsgiWebSocket:
+    """Минимальный WebSocket-клиент поверх ASGI-приложения в том же процессе"""
+
+    def __init__(self, app, path: str, cookie: str):
+        self.app = app
+        self.scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "http_version": "1.1",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"host", b"bench"), (b"cookie", f"session_id={cookie}".encode())],
+            "client": ("127.0.0.1", 0),
+            "server": ("bench", 80),
+            "subprotocols": [],
+        }
+        self.messages: asyncio.Queue = asyncio.Queue()
+        self._incoming: asyncio.Queue = asyncio.Queue()
+        self._accepted = None
+        self._task = None
+
+    async def connect(self):
+        self._accepted = asyncio.get_running_loop().create_future()
+        self._incoming.put_nowait({"type": "websocket.connect"})
+        self._task = asyncio.create_task(self.app(self.scope, self._incoming.get, self._send))
+        await self._accepted
+
+    async def _send(self, message: dict):
+        if message["type"] == "websocket.accept":
+            self._accepted.set_result(True)
+        elif message["type"] == "websocket.close" and not self._accepted.done():
+            self._accepted.set_exception(RuntimeError(f"WebSocket отклонен: {message.get('code')}"))
+        elif message["type"] == "websocket.send":
+            self.messages.put_nowait(json.loads(message["text"]))
+
+    async def close(self):
+        self._incoming.put_nowait({"type": "websocket.disconnect", "code": 1000})
+        await self._task
+
+
+class Bench:
+    def __init__(self, app):
+        import httpx
+
+        self.app = app
+        self.transport = httpx.ASGITransport(app=app)
+        self.clients = []
+
+    def client(self):
+        import httpx
+
+        client = httpx.AsyncClient(transport=self.transport, base_url="http://bench")
+        self.clients.append(client)
+        return client
+
+    async def close(self):
+        for client in self.clients:
+            await client.aclose()
+
+    async def seed(self):
+        from sqlalchemy import insert, select
+
+        from database import AsyncSessionLocal
+        from models import Message, Role, Task, TaskStatus, User
+        from passwords import hash_password_sync
+
+        # Один хэш на всех - иначе заполнение базы займет больше, чем сами замеры
+        password_hash = hash_password_sync(PASSWORD)
+        statuses = (TaskStatus.PENDING, TaskStatus.IN_PROGRESS, TaskStatus.COMPLETED)
+        async with AsyncSessionLocal() as db:
+            await db.execute(insert(User), [
+                {
+                    "username": f"bench{i}",
+                    "email": f"bench{i}@valve.com",
+                    "password_hash": password_hash,
+                    "role": Role.BOSS if i == 0 else Role.EMPLOYEE,
+                    "description": f"Сотрудник {i}",
+                }
+                for i in range(USERS)
+            ])
+            result = await db.execute(select(User.id, User.email))
+            users = {email: user_id for user_id, email in result.all()}
+            boss_id = users["bench0@valve.com"]
+            employee_ids = [users[f"bench{i}@valve.com"] for i in range(1, USERS)]
+            if TASKS:
+                await db.execute(insert(Task), [
+                    {
+                        "title": f"Задача {i}",
+                        "description": "Описание задачи для нагрузочного теста",
+                        "status": statuses[i % len(statuses)],
+                        "created_by_id": boss_id,
+                        "assigned_to_id": employee_ids[i % len(employee_ids)],
+                    }
+                    for i in range(TASKS)
+                ])
+            if MESSAGES:
+                await db.execute(insert(Message), [
+                    {
+                        "user_id": employee_ids[i % len(employee_ids)],
+                        "content": f"Сообщение {i} из истории чата",
+                        "message_type": "text",
+                    }
+                    for i in range(MESSAGES)
+                ])
+            await db.commit()
+
+    async def login(self, index: int):
+        client = self.client()
+        response = await client.post("/api/login", json={"email": f"bench{index}@valve.com", "password": PASSWORD})
+        response.raise_for_status()
+        return client
+
+    async def sessions(self, count: int, first: int = 1):
+        return await asyncio.gather(*(self.login(first + i % (USERS - 1)) for i in range(count)))
+
+    async def scenario_login(self) -> dict:
+        client = self.client()
+
+        async def request(i: int):
+            response = await client.post("/api/login", json={
+                "email": f"bench{1 + i % (USERS - 1)}@valve.com", "password": PASSWORD
+            })
+            response.raise_for_status()
+
+        latencies, errors, elapsed = await run_concurrently(LOGINS, CONCURRENCY, request)
+        return summarize(latencies, elapsed, errors)
+
+    async def scenario_profile(self) -> dict:
+        clients = await self.sessions(CONCURRENCY)
+
+        async def request(i: int):
+            response = await clients[i % len(clients)].get("/profile")
+            response.raise_for_status()
+
+        latencies, errors, elapsed = await run_concurrently(REQUESTS, CONCURRENCY, request)
+        return summarize(latencies, elapsed, errors)
+
+    async def scenario_tasks(self) -> dict:
+        # Начальник видит все задачи, сотрудники - только свои
+        clients = [await self.login(0), *await self.sessions(CONCURRENCY - 1)]
+
+        async def request(i: int):
+            response = await clients[i % len(clients)].get("/api/tasks")
+            response.raise_for_status()
+
+        latencies, errors, elapsed = await run_concurrently(REQUESTS, CONCURRENCY, request)
+        return summarize(latencies, elapsed, errors)
+
+    async def scenario_chat(self) -> dict:
+        sender = await self.login(1)
+        listeners = []
+        for client in await self.sessions(LISTENERS):
+            listener = AsgiWebSocket(self.app, "/ws/chat", client.cookies.get("session_id"))
+            await listener.connect()
+            listeners.append(listener)
+
+        sent_at = {}
+        received = {}  # содержимое -> сколько слушателей получили
+        delivered = {}  # содержимое -> время доставки последнему слушателю
+        all_delivered = asyncio.Event()
+
+        async def listen(listener: AsgiWebSocket):
+            while True:
+                message = await listener.messages.get()
+                content = message.get("content")
+                if content not in sent_at:
+                    continue
+                received[content] = received.get(content, 0) + 1
+                if received[content] == len(listeners):
+                    delivered[content] = time.perf_counter() - sent_at[content]
+                    if len(delivered) == CHAT_MESSAGES:
+                        all_delivered.set()
+
+        readers = [asyncio.create_task(listen(listener)) for listener in listeners]
+
+        async def request(i: int):
+            content = f"bench-message-{i}"
+            sent_at[content] = time.perf_counter()
+            response = await sender.post("/api/chat/message", data={"content": content})
+            response.raise_for_status()
+
+        try:
+            latencies, errors, elapsed = await run_concurrently(CHAT_MESSAGES, CONCURRENCY, request)
+            try:
+                await asyncio.wait_for(all_delivered.wait(), DELIVERY_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            for reader in readers:
+                reader.cancel()
+            for listener in listeners:
+                await listener.close()
+
+        fanout = list(delivered.values())
+        return summarize(
+            latencies, elapsed, errors,
+            listeners=len(listeners),
+            undelivered=CHAT_MESSAGES - len(fanout),
+            fanout_p50_ms=round(percentile(fanout, 0.50) * 1000, 2),
+            fanout_p99_ms=round(percentile(fanout, 0.99) * 1000, 2),
+        )
+
+    async def scenario_uploads(self) -> dict:
+        clients = await self.sessions(CONCURRENCY)
+        size = UPLOAD_KB * 1024
+
+        async def request(i: int):
+            # Разное содержимое, иначе одинаковые файлы сохраняются один раз
+            response = await clients[i % len(clients)].post(
+                "/api/chat/message",
+                files={"file": (f"bench{i}.mp3", os.urandom(size), "audio/mpeg")},
+            )
+            response.raise_for_status()
+
+        latencies, errors, elapsed = await run_concurrently(UPLOADS, CONCURRENCY, request)
+        return summarize(
+            latencies, elapsed, errors,
+            upload_kb=UPLOAD_KB,
+            mb_per_second=round(len(latencies) * size / elapsed / 2 ** 20, 1) if elapsed else 0.0,
+        )
+
+
+def queries_snapshot(route: str):
+    from metrics import REQUEST_QUERIES
+
+    entry = REQUEST_QUERIES.values.get((("route", route),))
+    return (entry[1], entry[2]) if entry else (0.0, 0)
+
+
+SCENARIO_ROUTES = {
+    "login": "/api/login",
+    "profile": "/profile",
+    "tasks": "/api/tasks",
+    "chat": "/api/chat/message",
+    "uploads": "/api/chat/message",
+}
+
+
+async def run(scenarios) -> dict:
+    from main import app
+
+    await app.router.startup()
+    bench = Bench(app)
+    results = {}
+    try:
+        started = time.perf_counter()
+        await bench.seed()
+        print(f"База заполнена за {time.perf_counter() - started:.1f} с", file=sys.stderr)
+
+        for name in scenarios:
+            route = SCENARIO_ROUTES[name]
+            queries_before, count_before = queries_snapshot(route)
+            result = await getattr(bench, f"scenario_{name}")()
+            queries_after, count_after = queries_snapshot(route)
+            if count_after > count_before:
+                result["db_queries_per_request"] = round(
+                    (queries_after - queries_before) / (count_after - count_before), 2
+                )
+            results[name] = result
+            print(f"{name}: {json.dumps(result, ensure_ascii=False)}", file=sys.stderr)
+    finally:
+        await bench.close()
+        await app.router.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", help="сценарии через запятую: " + ",".join(SCENARIOS))
+    parser.add_argument("--out", help="файл для JSON с результатами (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    scenarios = args.only.split(",") if args.only else list(SCENARIOS)
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(sorted(unknown))}")
+    out = os.path.abspath(args.out) if args.out else None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prepare_workdir(tmp)
+        # Приложение пишет лог через print - уводим его в stderr, в stdout только JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            results = asyncio.run(run(scenarios))
+        os.chdir(ROOT)
+
+    report = json.dumps({
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "params": {
+            "users": USERS, "tasks": TASKS, "messages": MESSAGES, "requests": REQUESTS,
+            "concurrency": CONCURRENCY, "logins": LOGINS, "listeners": LISTENERS,
+            "chat_messages": CHAT_MESSAGES, "uploads": UPLOADS, "upload_kb": UPLOAD_KB,
+        },
+        "scenarios": results,
+    }, ensure_ascii=False, indent=2)
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+import asyncio
+import json
+import os
+import time
+
+from metrics import BROADCAST_FANOUT
+
+try:
+    import fcntl
+except ImportError:  # Windows - доступен только бэкенд в памяти
+    fcntl = None
+
+# Бэкенд рассылки: memory (один процесс) или unix (несколько воркеров на одной машине)
+BROADCAST_BACKEND = os.getenv("BROADCAST_BACKEND", "memory")
+BROADCAST_SOCKET = os.getenv("BROADCAST_SOCKET", "/tmp/valve_portal_broadcast.sock")
+# Пауза перед повторным подключением к хабу
+BROADCAST_RETRY_SECONDS = 0.5
+# Максимальный размер одного сообщения между воркерами
+BROADCAST_FRAME_LIMIT = 2 ** 20
+# Сколько неотправленных байт хаб держит для одного воркера, прежде чем отключить его
+BROADCAST_PEER_BUFFER_LIMIT = int(os.getenv("BROADCAST_PEER_BUFFER_MB", "4")) * 2 ** 20
+
+Listener = Callable[[dict], Awaitable[None]]
+ResetListener = Callable[[], Awaitable[None]]
+
+
+class MemoryBroadcast:
+    """Рассылка сообщений подписчикам внутри одного процесса"""
+
+    def __init__(self):
+        self._listeners: Dict[str, List[Listener]] = {}
+        self._reset_listeners: List[ResetListener] = []
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def subscribe(self, channel: str, listener: Listener):
+        self._listeners.setdefault(channel, []).append(listener)
+
+    def unsubscribe(self, channel: str, listener: Listener):
+        listeners = self._listeners.get(channel, [])
+        if listener in listeners:
+            listeners.remove(listener)
+
+    def on_reset(self, listener: ResetListener):
+        """Вызывается, когда связь с другими воркерами потеряна или восстановлена:
+        часть сообщений могла не дойти, и кэши, которые строятся по рассылке, надо сбросить"""
+        self._reset_listeners.append(listener)
+
+    async def publish(self, channel: str, message: dict):
+        await self._deliver(channel, message)
+
+    async def _reset(self):
+        for listener in list(self._reset_listeners):
+            try:
+                await listener()
+            except Exception as e:
+                print(f"Ошибка при сбросе после переподключения рассылки: {e}")
+
+    async def _deliver(self, channel: str, message: dict):
+        started = time.perf_counter()
+        for listener in list(self._listeners.get(channel, [])):
+            try:
+                await listener(message)
+            except Exception as e:
+                print(f"Ошибка подписчика канала {channel}: {e}")
+        BROADCAST_FANOUT.observe(time.perf_counter() - started, channel=channel)
+
+
+class UnixSocketBroadcast(MemoryBroadcast):
+    """Рассылка между воркерами uvicorn через локальный Unix-сокет.
+
+    Воркер, захвативший файловую блокировку, становится хабом: слушает сокет
+    и пересылает каждое сообщение остальным воркерам. Остальные подключаются
+    к нему как клиенты. Если хаб завершился, блокировка освобождается и ее
+    забирает один из оставшихся воркеров.
+    """
+
+    def __init__(self, path: str = BROADCAST_SOCKET):
+        super().__init__()
+        self.path = path
+        self._lock_file = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._peers: Set[asyncio.StreamWriter] = set()
+        self._hub_writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_hub(self) -> bool:
+        return self._server is not None
+
+    async def start(self):
+        if fcntl is None:
+            raise RuntimeError("BROADCAST_BACKEND=unix поддерживается только на Linux/macOS")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        for writer in list(self._peers):
+            writer.close()
+        self._peers.clear()
+        if self._hub_writer:
+            self._hub_writer.close()
+            self._hub_writer = None
+        if self._server:
+            self._server.close()
+            self._server = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        if self._lock_file:
+            self._lock_file.close()
+            self._lock_file = None
+
+    async def publish(self, channel: str, message: dict):
+        await self._deliver(channel, message)
+
+        frame = self._encode(channel, message)
+        if len(frame) > BROADCAST_FRAME_LIMIT:
+            # Получатель не смог бы прочитать такую строку из сокета
+            print(f"Сообщение канала {channel} больше {BROADCAST_FRAME_LIMIT} байт, доставлено только локально")
+            return
+        if self.is_hub:
+            self._send_to_peers(frame)
+        elif self._hub_writer:
+            self._hub_writer.write(frame)
+        else:
+            print(f"Хаб рассылки недоступен, сообщение канала {channel} доставлено только локально")
+
+    async def _run(self):
+        connected_before = False
+        while True:
+            if self._acquire_lock():
+                if connected_before:
+                    await self._reset()
+                await self._serve()
+                return
+
+            try:
+                reader, writer = await asyncio.open_unix_connection(
+                    self.path, limit=BROADCAST_FRAME_LIMIT
+                )
+            except OSError:
+                await asyncio.sleep(BROADCAST_RETRY_SECONDS)
+                continue
+
+            self._hub_writer = writer
+            if connected_before:
+                await self._reset()
+            connected_before = True
+            try:
+                await self._read_frames(reader)
+            finally:
+                self._hub_writer = None
+                writer.close()
+            await self._reset()
+
+    def _acquire_lock(self) -> bool:
+        lock_file = open(self.path + ".lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    async def _serve(self):
+        # Сокет мог остаться от упавшего хаба - блокировка у нас, значит он ничей
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._server = await asyncio.start_unix_server(
+            self._handle_peer, self.path, limit=BROADCAST_FRAME_LIMIT
+        )
+        await self._server.serve_forever()
+
+    async def _handle_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._peers.add(writer)
+        try:
+            await self._read_frames(reader, source=writer)
+        finally:
+            self._peers.discard(writer)
+            writer.close()
+
+    async def _read_frames(self, reader: asyncio.StreamReader, source: Optional[asyncio.StreamWriter] = None):
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError as e:
+                # Строка длиннее BROADCAST_FRAME_LIMIT: readline уже выбросил ее из буфера
+                # (хвост придет следующей строкой и отбросится как битый кадр), соединение живо
+                print(f"Слишком длинное сообщение в сокете рассылки пропущено: {e}")
+                continue
+            except OSError as e:
+                print(f"Ошибка чтения из сокета рассылки: {e}")
+                return
+            if not line:
+                return
+
+            try:
+                frame = json.loads(line)
+                channel, message = frame["channel"], frame["message"]
+            except (ValueError, KeyError, TypeError) as e:
+                # Битый кадр пропускаем: из-за него нельзя терять всю рассылку
+                print(f"Некорректное сообщение в сокете рассылки: {e}")
+                continue
+            if source is not None:
+                # Мы хаб: пересылаем остальным воркерам
+                self._send_to_peers(line, exclude=source)
+            await self._deliver(channel, message)
+
+    def _send_to_peers(self, frame: bytes, exclude: Optional[asyncio.StreamWriter] = None):
+        for writer in list(self._peers):
+            if writer is exclude:
+                continue
+            # write не ждет отправки: буфер зависшего воркера растет без ограничений
+            if writer.transport.get_write_buffer_size() > BROADCAST_PEER_BUFFER_LIMIT:
+                print("Воркер не успевает читать рассылку, отключаем его")
+                self._peers.discard(writer)
+                writer.close()
+                continue
+            try:
+                writer.write(frame)
+            except Exception:
+                self._peers.discard(writer)
+
+    @staticmethod
+    def _encode(channel: str, message: dict) -> bytes:
+        return json.dumps({"channel": channel, "message": message}, ensure_ascii=False).encode() + b"\n"
+
+
+def create_broadcast():
+    if BROADCAST_BACKEND == "unix":
+        return UnixSocketBroadcast(BROADCAST_SOCKET)
+    if BROADCAST_BACKEND != "memory":
+        raise ValueError(f"Неизвестный BROADCAST_BACKEND: {BROADCAST_BACKEND}")
+    return MemoryBroadcast()
+
+
+broadcast = create_broadcast()
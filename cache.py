@@ -0,0 +1,307 @@
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+import json
+import os
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from models import User as UserModel
+from broadcast import broadcast
+from connections import encode_message
+
+# Настройки кэша сессий (можно переопределить через переменные окружения)
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+SESSION_CACHE_TTL = int(os.getenv("SESSION_CACHE_TTL", "30"))  # секунды
+
+# Буфер последних сообщений чата: количество и предел памяти
+CHAT_BUFFER_SIZE = int(os.getenv("CHAT_BUFFER_SIZE", "500"))
+CHAT_BUFFER_MAX_BYTES = int(os.getenv("CHAT_BUFFER_MAX_BYTES", str(1024 * 1024)))
+
+
+# Делаем отсоединенную копию пользователя, которую можно безопасно хранить между запросами
+def snapshot_user(user: UserModel) -> UserModel:
+    values = {attr.key: getattr(user, attr.key) for attr in inspect(UserModel).column_attrs}
+    copy = UserModel(**values)
+    make_transient_to_detached(copy)
+    return copy
+
+
+class SessionCache:
+    """LRU-кэш session_id -> снимок пользователя с ограничением по времени жизни.
+
+    Кэш живет внутри одного процесса, поэтому TTL держим коротким:
+    при нескольких воркерах выход из системы в другом воркере
+    подхватится не позже чем через SESSION_CACHE_TTL секунд.
+    """
+
+    def __init__(self, maxsize: int = SESSION_CACHE_SIZE, ttl: int = SESSION_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = timedelta(seconds=ttl)
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[UserModel, datetime]]" = OrderedDict()
+        self._by_user: Dict[int, Set[str]] = {}
+
+    def get(self, session_id: str) -> Optional[UserModel]:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        user, valid_until = entry
+        if valid_until <= datetime.utcnow():
+            self.invalidate(session_id)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(session_id)
+        self.hits += 1
+        return user
+
+    def set(self, session_id: str, user: UserModel, expires_at: datetime):
+        if self.maxsize <= 0 or self.ttl.total_seconds() <= 0:
+            return
+
+        # Запись не должна пережить саму сессию
+        valid_until = min(datetime.utcnow() + self.ttl, expires_at)
+        self.invalidate(session_id)
+        self._entries[session_id] = (snapshot_user(user), valid_until)
+        self._by_user.setdefault(user.id, set()).add(session_id)
+
+        while len(self._entries) > self.maxsize:
+            oldest_id = next(iter(self._entries))
+            self.invalidate(oldest_id)
+
+    def invalidate(self, session_id: str):
+        entry = self._entries.pop(session_id, None)
+        if entry is None:
+            return
+        user_id = entry[0].id
+        sessions = self._by_user.get(user_id)
+        if sessions is not None:
+            sessions.discard(session_id)
+            if not sessions:
+                del self._by_user[user_id]
+
+    def invalidate_user(self, user_id: int):
+        for session_id in list(self._by_user.get(user_id, ())):
+            self.invalidate(session_id)
+
+    def clear(self):
+        self._entries.clear()
+        self._by_user.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": int(self.ttl.total_seconds()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class RecentMessages:
+    """Кольцевой буфер последних сообщений чата в виде готового JSON.
+
+    complete_from - ниже этого id буфер ничего не знает о сообщениях. Запрос
+    отдается из буфера, только если его ответ целиком лежит выше complete_from
+    и id в нем идут подряд, иначе вызывающий идет в БД: сообщения публикуются
+    не в порядке id (запись и рассылка у send_message и MessageWriter независимы),
+    а без хаба рассылки часть сообщений других воркеров вообще не доходит.
+    Пропуск из-за удаленного или откатившегося id тоже уводит запрос в БД -
+    это дороже, но никогда не теряет сообщений.
+    """
+
+    def __init__(self, maxlen: int = CHAT_BUFFER_SIZE, max_bytes: int = CHAT_BUFFER_MAX_BYTES):
+        self.maxlen = maxlen
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.warm = False
+        self.complete_from = 0
+        self._ids: List[int] = []
+        self._payloads: List[bytes] = []
+        self._size = 0
+        # Сообщения, пришедшие во время прогрева, и номер поколения для отмены устаревшего прогрева
+        self._pending: Optional[List[dict]] = None
+        self._generation = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxlen > 0 and self.max_bytes > 0
+
+    @property
+    def warming(self) -> bool:
+        return self._pending is not None
+
+    def clear(self):
+        self.warm = False
+        self.complete_from = 0
+        self._ids.clear()
+        self._payloads.clear()
+        self._size = 0
+        self._pending = None
+        self._generation += 1
+
+    def start_warming(self) -> int:
+        """Вызывается перед запросом к БД; сообщения, пришедшие до fill, не потеряются"""
+        self._pending = []
+        return self._generation
+
+    def abort_warming(self, generation: int):
+        """Запрос к БД не удался: без этого буфер навсегда остался бы в прогреве"""
+        if generation == self._generation and not self.warm:
+            self._pending = None
+
+    def fill(self, messages: List[dict], complete: bool, generation: int):
+        """Прогрев из БД: messages - последние сообщения по возрастанию id,
+        complete - более старых сообщений в БД нет"""
+        # Пока шел запрос, буфер сбросили - данные могли устареть
+        if generation != self._generation:
+            return
+        pending = self._pending or []
+        self.clear()
+        if not self.enabled:
+            return
+        for message in messages + pending:
+            self._insert(message)
+        self.complete_from = 0 if complete or not self._ids else self._ids[0]
+        self.warm = True
+        self._evict()
+
+    def add(self, message: dict):
+        if self._pending is not None and not self.warm:
+            self._pending.append(message)
+            # После прогрева старше последних maxlen сообщений все равно ничего не останется
+            if len(self._pending) > self.maxlen:
+                del self._pending[0]
+            return
+        # В холодный буфер не пишем: без прогрева нельзя гарантировать, что в нем нет пропусков
+        if not self.warm:
+            return
+        self._insert(message)
+        self._evict()
+
+    def update(self, message_id: int, fields: dict):
+        index = bisect_left(self._ids, message_id)
+        if index == len(self._ids) or self._ids[index] != message_id:
+            return
+        message = json.loads(self._payloads[index])
+        message.update(fields)
+        payload = encode_message(message).encode()
+        self._size += len(payload) - len(self._payloads[index])
+        self._payloads[index] = payload
+
+    async def on_chat_event(self, message: dict):
+        """Подписчик канала chat: новые сообщения и обновления миниатюр"""
+        if message.get("type") == "message_update":
+            self.update(message["id"], {"thumbnail_path": message["thumbnail_path"]})
+        elif "type" not in message:
+            self.add(message)
+
+    def get(self, before_id: Optional[int], after_id: Optional[int], limit: int) -> Optional[bytes]:
+        """JSON-массив сообщений (по возрастанию id) или None, если нужен запрос к БД"""
+        if not self.warm:
+            self.misses += 1
+            return None
+
+        hi = len(self._ids) if before_id is None else bisect_left(self._ids, before_id)
+        if after_id is not None:
+            # Между after_id и началом буфера могут быть сообщения, которых в нем нет
+            if after_id + 1 < self.complete_from:
+                self.misses += 1
+                return None
+            lo = bisect_right(self._ids, after_id)
+            hi = min(hi, lo + limit)
+        else:
+            lo = max(0, hi - limit)
+            # Страница не поместилась в буфер, а в БД есть более старые сообщения
+            if hi - lo < limit and self.complete_from > 0:
+                self.misses += 1
+                return None
+
+        # Между границами запроса и внутри страницы не должно быть пропусков id
+        first = after_id + 1 if after_id is not None else None
+        last = before_id - 1 if before_id is not None and hi > lo else None
+        if not self._contiguous(lo, hi, first, last):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return b"[" + b",".join(self._payloads[lo:hi]) + b"]"
+
+    def _contiguous(self, lo: int, hi: int, first: Optional[int], last: Optional[int]) -> bool:
+        if lo == hi:
+            return True
+        first = self._ids[lo] if first is None else first
+        last = self._ids[hi - 1] if last is None else last
+        # id уникальны и отсортированы: подряд, если их ровно столько, сколько чисел в диапазоне
+        return self._ids[lo] == first and self._ids[hi - 1] == last and last - first + 1 == hi - lo
+
+    def _insert(self, message: dict):
+        message_id = message["id"]
+        index = bisect_left(self._ids, message_id)
+        if index < len(self._ids) and self._ids[index] == message_id:
+            return
+        # Сообщение старше начала буфера - оно уже вытеснено, возвращать его нельзя
+        if self.warm and self.complete_from > 0 and message_id < self.complete_from:
+            return
+        payload = encode_message(message).encode()
+        self._ids.insert(index, message_id)
+        self._payloads.insert(index, payload)
+        self._size += len(payload)
+
+    def _evict(self):
+        while self._ids and (len(self._ids) > self.maxlen or self._size > self.max_bytes):
+            self._ids.pop(0)
+            self._size -= len(self._payloads.pop(0))
+            if not self._ids:
+                # Вытеснили все - дальше только через повторный прогрев
+                self.clear()
+                return
+            self.complete_from = self._ids[0]
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._ids),
+            "bytes": self._size,
+            "maxlen": self.maxlen,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+session_cache = SessionCache()
+recent_messages = RecentMessages()
+
+
+# Сброс кэшей во всех воркерах: сессии пользователя и буфер сообщений (в нем имя и аватарка)
+async def invalidate_user(user_id: int):
+    await broadcast.publish("invalidate", {"user_id": user_id})
+
+
+# Сброс одной сессии во всех воркерах (выход из системы)
+async def invalidate_session(session_id: str):
+    await broadcast.publish("invalidate", {"session_id": session_id})
+
+
+async def on_invalidate(message: dict):
+    if "session_id" in message:
+        session_cache.invalidate(message["session_id"])
+    if "user_id" in message:
+        session_cache.invalidate_user(message["user_id"])
+        recent_messages.clear()
+
+
+# Пока не было связи с хабом, сюда не дошли чужие сообщения и сбросы - буфер прогреется заново
+async def on_broadcast_reset():
+    session_cache.clear()
+    recent_messages.clear()
@@ -0,0 +1,141 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+import html
+import re
+
+from sqlalchemy import column, func, inspect, literal_column, select, table
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from models import Message as MessageModel
+
+# Не больше стольких слов из запроса
+SEARCH_MAX_TERMS = 10
+# Слов вокруг совпадения во фрагменте
+SNIPPET_TOKENS = 12
+SNIPPET_CHARS = 80  # для поиска через LIKE
+# Границы совпадений во фрагменте: управляющие символы не встречаются в тексте и
+# переживают html.escape, после экранирования заменяются на <mark>
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+# Должно совпадать с индексом из миграции 0005, иначе PostgreSQL его не использует
+PG_VECTOR = literal_column("to_tsvector('russian', coalesce(messages.content, ''))")
+PG_HEADLINE_OPTIONS = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, MaxFragments=1, MaxWords=20, MinWords=5"
+
+messages_fts = table("messages_fts", column("rowid"), column("rank"))
+FTS_TABLE = literal_column("messages_fts")
+
+
+def search_terms(query: str) -> List[str]:
+    return re.findall(r"\w+", query.lower())[:SEARCH_MAX_TERMS]
+
+
+def fts5_query(terms: List[str]) -> str:
+    # Каждое слово в кавычках (операторы FTS5 из ввода не работают), последнее - по префиксу
+    return " ".join(f'"{term}"' for term in terms) + "*"
+
+
+def tsquery(terms: List[str]) -> str:
+    return " & ".join(terms) + ":*"
+
+
+def highlight(fragment: str) -> str:
+    """Фрагмент с совпадениями для вставки в HTML: текст экранирован, совпадения в <mark>"""
+    return html.escape(fragment).replace(HIGHLIGHT_START, "<mark>").replace(HIGHLIGHT_END, "</mark>")
+
+
+def like_snippet(content: Optional[str], terms: List[str]) -> str:
+    if not content:
+        return ""
+    pattern = re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE)
+    match = pattern.search(content)
+    start = max(0, match.start() - SNIPPET_CHARS // 2) if match else 0
+    fragment = content[start:start + SNIPPET_CHARS]
+    fragment = pattern.sub(lambda m: f"{HIGHLIGHT_START}{m.group(0)}{HIGHLIGHT_END}", fragment)
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if start + SNIPPET_CHARS < len(content) else ""
+    return prefix + fragment + suffix
+
+
+def escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class ChatSearch:
+    """Поиск по сообщениям чата: FTS5 в SQLite, tsvector + GIN в PostgreSQL.
+
+    Если SQLite собран без FTS5 (таблицы messages_fts нет), ищем через LIKE -
+    медленно, но работает. Способ определяется при запуске (detect).
+    """
+
+    def __init__(self):
+        self.backend = "like"
+
+    async def detect(self, db: AsyncSession):
+        connection = await db.connection()
+        if connection.dialect.name == "postgresql":
+            self.backend = "postgres"
+            return
+        has_fts = await connection.run_sync(lambda conn: inspect(conn).has_table("messages_fts"))
+        self.backend = "fts5" if has_fts else "like"
+
+    def statement(
+        self,
+        terms: List[str],
+        user_id: Optional[int] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+    ):
+        """Запрос (сообщение, фрагмент) по убыванию релевантности, без LIMIT/OFFSET"""
+        if self.backend == "fts5":
+            query = (
+                select(MessageModel, func.snippet(
+                    FTS_TABLE, 0, HIGHLIGHT_START, HIGHLIGHT_END, "…", SNIPPET_TOKENS
+                ).label("snippet"))
+                .join(messages_fts, messages_fts.c.rowid == MessageModel.id)
+                .where(FTS_TABLE.op("MATCH")(fts5_query(terms)))
+                # rank - bm25, чем меньше, тем релевантнее; сортирует сам FTS5, без временного B-дерева
+                .order_by(messages_fts.c.rank)
+            )
+        elif self.backend == "postgres":
+            ts_query = func.to_tsquery(literal_column("'russian'"), tsquery(terms))
+            query = (
+                select(MessageModel, func.ts_headline(
+                    literal_column("'russian'"), func.coalesce(MessageModel.content, ""),
+                    ts_query, PG_HEADLINE_OPTIONS
+                ).label("snippet"))
+                .where(PG_VECTOR.op("@@")(ts_query))
+                .order_by(func.ts_rank_cd(PG_VECTOR, ts_query).desc(), MessageModel.id.desc())
+            )
+        else:
+            query = select(MessageModel, MessageModel.content.label("snippet")).order_by(MessageModel.id.desc())
+            for term in terms:
+                query = query.where(MessageModel.content.ilike(f"%{escape_like(term)}%", escape="\\"))
+
+        if user_id is not None:
+            query = query.where(MessageModel.user_id == user_id)
+        if created_from is not None:
+            query = query.where(MessageModel.created_at >= created_from)
+        if created_to is not None:
+            query = query.where(MessageModel.created_at < created_to)
+        return query
+
+    async def search(
+        self,
+        db: AsyncSession,
+        terms: List[str],
+        limit: int,
+        offset: int = 0,
+        **filters
+    ) -> List[Tuple[MessageModel, str]]:
+        """Страница результатов: (сообщение с загруженным автором, фрагмент в HTML)"""
+        query = self.statement(terms, **filters).options(selectinload(MessageModel.user))
+        result = await db.execute(query.offset(offset).limit(limit))
+        rows = result.all()
+        if self.backend == "like":
+            return [(message, highlight(like_snippet(message.content, terms))) for message, _ in rows]
+        return [(message, highlight(snippet or "")) for message, snippet in rows]
+
+
+chat_search = ChatSearch()
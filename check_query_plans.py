@@ -0,0 +1,137 @@
+"""Проверка планов запросов для частых запросов приложения.
+
+Создает временную базу SQLite, применяет все миграции и для каждого запроса
+выводит EXPLAIN QUERY PLAN. Если какой-то запрос читает таблицу целиком
+(SCAN без индекса), скрипт завершается с кодом 1.
+
+Запуск: python check_query_plans.py
+"""
+from datetime import datetime
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, delete, func, select, update
+
+from chat_search import ChatSearch
+from session_reaper import reap_statement, excess_sessions_statement
+from models import User as UserModel, Task as TaskModel, UserSession as SessionModel, Message as MessageModel, Role
+
+# Полный проход по таблице: "SCAN users", но не "SCAN users USING INDEX ..."
+# и не поиск по полнотекстовому индексу "SCAN messages_fts VIRTUAL TABLE INDEX ..."
+FULL_SCAN = re.compile(r"^SCAN (\w+)\b(?! USING (COVERING )?INDEX| VIRTUAL TABLE INDEX)")
+# Чтение таблицы по первичному ключу с LIMIT: SQLite идет с конца и останавливается
+# после limit строк, без сортировки - такой SCAN допустим
+ORDERED_SCANS = {"get_messages (последняя страница)"}
+
+
+# Запросы повторяют то, что выполняют эндпоинты в main.py
+def hot_queries():
+    now = datetime.utcnow()
+    fts = ChatSearch()
+    fts.backend = "fts5"
+    return {
+        "get_current_user (сессия + пользователь)":
+            select(UserModel, SessionModel.expires_at)
+            .join(SessionModel, SessionModel.user_id == UserModel.id)
+            .where(SessionModel.session_id == "session", SessionModel.expires_at > now),
+        "extend_session_db":
+            update(SessionModel)
+            .where(SessionModel.session_id == "session")
+            .values(expires_at=now),
+        "logout":
+            delete(SessionModel).where(SessionModel.session_id == "session"),
+        "очистка просроченных сессий (session_reaper)":
+            reap_statement(now, 1000),
+        "лимит сессий пользователя (create_session_db)":
+            excess_sessions_statement(1, 10),
+        "login (поиск по email)":
+            select(UserModel).where(UserModel.email == "boss@valve.com"),
+        "register (поиск по username)":
+            select(UserModel).where(UserModel.username == "boss"),
+        "get_users (сотрудники)":
+            select(UserModel).where(UserModel.role == Role.EMPLOYEE),
+        "get_users (руководители)":
+            select(UserModel).where(UserModel.role == Role.BOSS),
+        "selectinload пользователей":
+            select(UserModel).where(UserModel.id.in_([1, 2, 3])),
+        "get_tasks / profile_page (руководитель)":
+            select(TaskModel).where(TaskModel.created_by_id == 1),
+        "get_tasks / profile_page (сотрудник)":
+            select(TaskModel).where(TaskModel.assigned_to_id == 1),
+        "get_tasks (страница с фильтром по статусу)":
+            select(TaskModel)
+            .where(TaskModel.created_by_id == 1, TaskModel.status == "pending", TaskModel.id < 1000)
+            .order_by(TaskModel.id.desc()).limit(20),
+        "get_task_counts":
+            select(TaskModel.status, func.count(TaskModel.id))
+            .where(TaskModel.assigned_to_id == 1).group_by(TaskModel.status),
+        "update_task":
+            select(TaskModel).where(TaskModel.id == 1),
+        "get_messages (последняя страница)":
+            select(MessageModel).order_by(MessageModel.id.desc()).limit(50),
+        "get_messages (before_id)":
+            select(MessageModel).where(MessageModel.id < 1000).order_by(MessageModel.id.desc()).limit(50),
+        "get_messages (after_id)":
+            select(MessageModel).where(MessageModel.id > 1000).order_by(MessageModel.id.asc()).limit(50),
+        "сообщения пользователя":
+            select(MessageModel).where(MessageModel.user_id == 1).order_by(MessageModel.id.desc()).limit(50),
+        "search_messages (FTS5)":
+            fts.statement(["valve", "hal"]).limit(20),
+        "search_messages (FTS5, автор и даты)":
+            fts.statement(["valve"], user_id=1, created_from=now, created_to=now).limit(20),
+    }
+
+
+def explain(conn, statement):
+    compiled = statement.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.construct_params()
+    args = []
+    for name in compiled.positiontup:
+        value = params[name]
+        args.append(value.isoformat(" ") if isinstance(value, datetime) else value)
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + compiled.string, tuple(args)).fetchall()
+    return [row[-1] for row in rows]
+
+
+def main() -> int:
+    tmp_dir = tempfile.mkdtemp(prefix="valve_portal_plans_")
+    path = os.path.join(tmp_dir, "plans.db")
+    engine = create_engine(f"sqlite:///{path}")
+    failed = []
+
+    try:
+        with engine.begin() as conn:
+            config = Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini"))
+            config.attributes["connection"] = conn
+            command.upgrade(config, "head")
+
+        with engine.connect() as conn:
+            # Без статистики планировщик выбирает индексы по умолчанию - как на свежей базе
+            for name, statement in hot_queries().items():
+                plan = explain(conn, statement)
+                scans = [line for line in plan if FULL_SCAN.match(line)]
+                if name in ORDERED_SCANS and not any("TEMP B-TREE" in line for line in plan):
+                    scans = []
+                print(f"{'FAIL' if scans else 'ok  '} {name}")
+                for line in plan:
+                    print(f"       {line}")
+                if scans:
+                    failed.append(name)
+    finally:
+        engine.dispose()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if failed:
+        print(f"\nПолный проход по таблице в запросах: {', '.join(failed)}")
+        return 1
+    print("\nВсе запросы используют индексы")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
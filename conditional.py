@@ -0,0 +1,91 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Callable, Iterable, Optional, Tuple
+import hashlib
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+# Браузер хранит ответ, но каждый раз переспрашивает сервер с If-None-Match.
+# fetch() делает это сам и отдает скрипту закэшированное тело при ответе 304
+CONDITIONAL_CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    # Слабый ETag: одинаковые данные, а не побайтно одинаковое тело
+    return f'W/"{hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()}"'
+
+
+def bytes_etag(content: bytes) -> str:
+    return f'W/"{hashlib.blake2b(content, digest_size=16).hexdigest()}"'
+
+
+def rows_validators(rows: Iterable, *scope) -> Tuple[str, Optional[datetime]]:
+    """ETag и Last-Modified по версиям строк (таблица, id, updated_at) без сериализации ответа.
+
+    scope - все, от чего еще зависит ответ (например, id текущего пользователя).
+    Last-Modified годится только для одной строки: у списка максимум updated_at
+    не меняется, когда строка из него пропадает, поэтому списки отдаются с одним ETag.
+    """
+    versions = []
+    last_modified = None
+    for row in rows:
+        if row is None:
+            versions.append(None)
+            continue
+        versions.append((row.__tablename__, row.id, row.updated_at))
+        if last_modified is None or row.updated_at > last_modified:
+            last_modified = row.updated_at
+    return make_etag(scope, versions), last_modified
+
+
+def http_date(value: datetime) -> str:
+    return format_datetime(value.replace(tzinfo=timezone.utc), usegmt=True)
+
+
+def _strip_weak(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-Modified-Since при этом не смотрим (RFC 9110)
+        tags = {_strip_weak(tag.strip()) for tag in if_none_match.split(",")}
+        return "*" in tags or _strip_weak(etag) in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # В заголовке точность до секунды
+        return last_modified.replace(microsecond=0, tzinfo=timezone.utc) <= since
+    return False
+
+
+def conditional_response(
+    request: Request,
+    etag: str,
+    last_modified: Optional[datetime],
+    build: Callable[[], object]
+) -> Response:
+    """304 без вызова build, если у клиента актуальная версия, иначе JSON из build().
+
+    build может вернуть готовый JSON в bytes (буфер сообщений) или данные для сериализации.
+    """
+    headers = {"ETag": etag, "Cache-Control": CONDITIONAL_CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    content = build()
+    if isinstance(content, bytes):
+        return Response(content=content, media_type="application/json", headers=headers)
+    return JSONResponse(jsonable_encoder(content), headers=headers)
@@ -0,0 +1,149 @@
+from typing import Dict, Set
+import asyncio
+import json
+import os
+
+from fastapi.websockets import WebSocket
+
+# Сколько сообщений может ждать отправки одному клиенту, прежде чем мы его отключим
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+# Код закрытия для медленного клиента: "Try Again Later" - клиент переподключится сам
+WS_SLOW_CONSUMER_CLOSE_CODE = 1013
+
+# Задачи закрытия медленных клиентов: цикл событий держит задачи по слабой ссылке
+_close_tasks: Set[asyncio.Task] = set()
+
+
+def encode_message(message: dict) -> str:
+    # Тот же формат, что и у WebSocket.send_json
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+class ChatConnection:
+    """WebSocket-клиент с собственной очередью исходящих сообщений и задачей-писателем"""
+
+    def __init__(self, websocket: WebSocket, queue_size: int = WS_SEND_QUEUE_SIZE):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def push(self, text: str) -> bool:
+        """Кладет готовый JSON в очередь, не дожидаясь отправки. False - очередь переполнена"""
+        try:
+            self.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def send_json(self, message: dict) -> bool:
+        return self.push(encode_message(message))
+
+    async def _write_loop(self):
+        try:
+            while True:
+                text = await self.queue.get()
+                await self.websocket.send_text(text)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Соединение закрыто - дальше отправлять нечего, приемник сам вызовет disconnect
+            pass
+
+    def stop(self):
+        self._writer.cancel()
+
+    async def close(self, code: int = 1000):
+        self.stop()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    def close_later(self, code: int = 1000):
+        """Закрытие в фоне - для синхронного кода, который раскладывает сообщения по очередям"""
+        task = asyncio.create_task(self.close(code=code))
+        _close_tasks.add(task)
+        task.add_done_callback(_close_tasks.discard)
+
+
+class ConnectionManager:
+    """WebSocket-соединения чата в текущем воркере"""
+
+    def __init__(self, queue_size: int = WS_SEND_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.connections: Set[ChatConnection] = set()
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self.connections)
+
+    async def connect(self, websocket: WebSocket) -> ChatConnection:
+        await websocket.accept()
+        connection = ChatConnection(websocket, self.queue_size)
+        self.connections.add(connection)
+        return connection
+
+    def disconnect(self, connection: ChatConnection):
+        self.connections.discard(connection)
+        connection.stop()
+
+    async def send_to_all(self, message: dict):
+        # Сериализуем один раз и только раскладываем по очередям - отправку делают писатели
+        text = encode_message(message)
+        for connection in list(self.connections):
+            if not connection.push(text):
+                self._drop_slow(connection)
+
+    def _drop_slow(self, connection: ChatConnection):
+        self.connections.discard(connection)
+        self.dropped += 1
+        connection.close_later(code=WS_SLOW_CONSUMER_CLOSE_CODE)
+
+
+class UserConnectionManager:
+    """WebSocket-соединения текущего воркера по пользователям: события адресованы конкретным людям"""
+
+    def __init__(self, queue_size: int = WS_SEND_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.connections: Dict[int, Set[ChatConnection]] = {}
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return sum(len(connections) for connections in self.connections.values())
+
+    async def connect(self, websocket: WebSocket, user_id: int) -> ChatConnection:
+        await websocket.accept()
+        connection = ChatConnection(websocket, self.queue_size)
+        self.connections.setdefault(user_id, set()).add(connection)
+        return connection
+
+    def disconnect(self, user_id: int, connection: ChatConnection):
+        self._discard(user_id, connection)
+        connection.stop()
+
+    def send_to_user(self, user_id: int, message: dict):
+        connections = self.connections.get(user_id)
+        if not connections:
+            return
+        text = encode_message(message)
+        for connection in list(connections):
+            if not connection.push(text):
+                self._discard(user_id, connection)
+                self.dropped += 1
+                connection.close_later(code=WS_SLOW_CONSUMER_CLOSE_CODE)
+
+    async def on_event(self, message: dict):
+        """Подписчик канала рассылки: {"user_id": ..., "event": {...}}"""
+        self.send_to_user(message["user_id"], message["event"])
+
+    def _discard(self, user_id: int, connection: ChatConnection):
+        connections = self.connections.get(user_id)
+        if connections is None:
+            return
+        connections.discard(connection)
+        if not connections:
+            del self.connections[user_id]
+
+
+chat_connections = ConnectionManager()
+task_connections = UserConnectionManager()
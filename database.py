@@ -1,11 +1,28 @@
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy import event, text
 import os
+import tempfile
+import time
 from dotenv import load_dotenv
 
+from metrics import DB_POOL_WAIT, instrument_engine
+
+try:
+    import fcntl
+except ImportError:  # Windows - там приложение запускается одним процессом
+    fcntl = None
+
 # Загружаем переменные окружения
 load_dotenv()
 
+
+def env_bool(name: str, default: bool = False) -> bool:
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+
 # URL подключения к SQLite
 # SQLite - файловая база данных, не требует отдельного сервера
 DATABASE_URL = os.getenv(
@@ -13,10 +30,112 @@ DATABASE_URL = os.getenv(
     "sqlite+aiosqlite:///./valve_portal.db"
 )
 
+# Хостинги (Render, Heroku) выдают postgres:// - переводим на асинхронный драйвер asyncpg
+for prefix in ("postgres://", "postgresql://"):
+    if DATABASE_URL.startswith(prefix):
+        DATABASE_URL = "postgresql+asyncpg://" + DATABASE_URL[len(prefix):]
+
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+IS_MEMORY_SQLITE = IS_SQLITE and make_url(DATABASE_URL).database in (None, "", ":memory:")
+
+# Логирование SQL (в продакшене выключено - каждый запрос в stdout заметно тормозит)
+DB_ECHO = env_bool("DB_ECHO")
+
+# Пул соединений
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # секунды ожидания свободного соединения
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # пересоздавать соединения старше N секунд
+DB_POOL_PRE_PING = env_bool("DB_POOL_PRE_PING", not IS_SQLITE)
+
+# PRAGMA для SQLite: WAL позволяет читать во время записи
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+}
+
+# Настройки asyncpg для PostgreSQL
+PG_STATEMENT_CACHE_SIZE = int(os.getenv("PG_STATEMENT_CACHE_SIZE", "100"))
+PG_COMMAND_TIMEOUT = int(os.getenv("PG_COMMAND_TIMEOUT", "30"))
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, который замеряет, сколько запрос ждал свободное соединение"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - started)
+
+
+def engine_options() -> dict:
+    options = {"echo": DB_ECHO}
+
+    if IS_SQLITE:
+        # Для SQLite нужны специальные параметры для работы с async
+        options["connect_args"] = {"check_same_thread": False}
+    else:
+        options["connect_args"] = {
+            "statement_cache_size": PG_STATEMENT_CACHE_SIZE,
+            "command_timeout": PG_COMMAND_TIMEOUT,
+            "server_settings": {"application_name": "valve-portal"},
+        }
+
+    # База в памяти живет в одном соединении - пул для нее не настраиваем
+    if not IS_MEMORY_SQLITE:
+        options.update(
+            poolclass=TimedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
+    return options
+
+
 # Создаем движок базы данных
-# Для SQLite нужны специальные параметры для работы с async
-connect_args = {"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-engine = create_async_engine(DATABASE_URL, echo=True, connect_args=connect_args)
+engine = create_async_engine(DATABASE_URL, **engine_options())
+# Число и время SQL-запросов для /metrics
+instrument_engine(engine.sync_engine)
+
+
+# Применяем PRAGMA к каждому новому соединению SQLite
+if IS_SQLITE:
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+# Итоговые настройки подключения (пароль скрыт) - выводятся при запуске
+def engine_report() -> dict:
+    report = {
+        "url": make_url(DATABASE_URL).render_as_string(hide_password=True),
+        "echo": DB_ECHO,
+        "pool": type(engine.pool).__name__,
+    }
+    if not IS_MEMORY_SQLITE:
+        report.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
+    if IS_SQLITE:
+        report["pragmas"] = SQLITE_PRAGMAS
+    else:
+        report["statement_cache_size"] = PG_STATEMENT_CACHE_SIZE
+        report["command_timeout"] = PG_COMMAND_TIMEOUT
+    return report
+
 
 # Создаем фабрику сессий
 AsyncSessionLocal = async_sessionmaker(
@@ -38,8 +157,34 @@ async def get_db() -> AsyncSession:
             await session.close()
 
 
-# Функция для создания таблиц
-async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+# Ревизия, соответствующая схеме, которую раньше создавал create_all
+BASELINE_REVISION = "0001"
+# Блокировка, чтобы несколько воркеров не применяли миграции одновременно
+MIGRATION_LOCK_FILE = os.getenv("DB_MIGRATION_LOCK", os.path.join(tempfile.gettempdir(), "valve_portal_migrations.lock"))
+MIGRATION_PG_LOCK_ID = 7_140_250
+
 
+def run_migrations(conn):
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini"))
+    config.attributes["connection"] = conn
+    # Базы, созданные до перехода на миграции, помечаются исходной ревизией в alembic/env.py
+    command.upgrade(config, "head")
+
+
+# Функция для создания и обновления таблиц (миграции Alembic)
+async def init_db():
+    lock_file = None
+    if IS_SQLITE and fcntl is not None:
+        lock_file = open(MIGRATION_LOCK_FILE, "w")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+    try:
+        async with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                await conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_PG_LOCK_ID})
+            await conn.run_sync(run_migrations)
+    finally:
+        if lock_file:
+            lock_file.close()
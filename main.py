@@ -1,20 +1,33 @@
-from fastapi import FastAPI, HTTPException, Request, status, Depends, UploadFile, File, Form
-from fastapi.responses import JSONResponse, RedirectResponse, FileResponse
+from fastapi import FastAPI, HTTPException, Request, status, Depends, UploadFile, File, Form, Query
+from fastapi.responses import JSONResponse, RedirectResponse, FileResponse, Response, PlainTextResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.websockets import WebSocket, WebSocketDisconnect
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import List, Optional
 import asyncio
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import secrets
-import hashlib
 from enum import Enum
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, update, delete, func
 from sqlalchemy.orm import selectinload
 
-from database import get_db, init_db, AsyncSessionLocal
+from database import get_db, init_db, engine_report, AsyncSessionLocal
+from cache import session_cache, recent_messages, invalidate_user, invalidate_session, on_invalidate, on_broadcast_reset
+from broadcast import broadcast
+from connections import chat_connections, task_connections, ChatConnection
+from message_writer import message_writer
+from uploads import UPLOAD_LIMITS, CHAT_MEDIA_TYPES, CachedStaticFiles, UploadLimitMiddleware, detect_media_type, save_upload, release_upload
+from media import media_processor
+from assets import AssetStaticFiles, asset_manifest, asset_url
+from metrics import metrics, MetricsMiddleware
+from page_cache import page_cache
+from chat_search import chat_search, search_terms
+from conditional import conditional_response, rows_validators, bytes_etag
+from passwords import password_hasher, needs_rehash
+from session_reaper import session_reaper, SESSION_MAX_PER_USER, excess_sessions_statement
 from models import User as UserModel, Task as TaskModel, UserSession as SessionModel, Message as MessageModel, Role, TaskStatus
 
 # Создаем экземпляр FastAPI приложения
@@ -23,17 +36,26 @@ app = FastAPI(
     description="Корпоративный портал компании Valve",
     version="2.0.0"
 )
+# Загрузки больше допустимого размера отклоняем до разбора формы (внутри метрик, чтобы 413 попадали в них)
+app.add_middleware(UploadLimitMiddleware, limits={
+    "/api/upload-avatar": UPLOAD_LIMITS["avatar"],
+    "/api/chat/message": max(UPLOAD_LIMITS[media_type] for media_type in CHAT_MEDIA_TYPES),
+})
+# Время ответа, коды и число SQL-запросов по маршрутам - для /metrics
+app.add_middleware(MetricsMiddleware)
 
 # Создаем папки для загрузок (перед монтированием)
 import os
-os.makedirs("uploads/avatars", exist_ok=True)
-os.makedirs("uploads/chat/images", exist_ok=True)
-os.makedirs("uploads/chat/videos", exist_ok=True)
-os.makedirs("uploads/chat/audio", exist_ok=True)
+os.makedirs("uploads/media", exist_ok=True)
+os.makedirs("uploads/tmp", exist_ok=True)
 
 # Настройка статических файлов и шаблонов
 templates = Jinja2Templates(directory="templates")
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Ссылки на статику с хэшем содержимого: {{ asset_url('style.css') }}
+templates.env.globals["asset_url"] = asset_url
+app.mount("/static", AssetStaticFiles(directory="static"), name="static")
+# Файлы в хранилище по содержимому не меняются - отдаем с долгим кэшем
+app.mount("/uploads/media", CachedStaticFiles(directory="uploads/media"), name="media")
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
 
@@ -89,21 +111,42 @@ class TaskResponse(TaskBase):
 class TaskUpdate(BaseModel):
     status: Optional[TaskStatusEnum] = None
 
+# Максимум задач в одном пакетном запросе
+TASKS_BULK_LIMIT = 500
+# Максимальная длина текста сообщения чата; в UTF-8 с экранированием JSON это намного меньше
+# предела рассылки между воркерами (broadcast.BROADCAST_FRAME_LIMIT)
+CHAT_MESSAGE_MAX_CHARS = int(os.getenv("CHAT_MESSAGE_MAX_CHARS", "4000"))
+
+class TaskBulkCreate(BaseModel):
+    tasks: List[TaskCreate] = Field(..., min_length=1, max_length=TASKS_BULK_LIMIT)
+
+class TaskStatusChange(BaseModel):
+    id: int
+    status: TaskStatusEnum
+
+class TaskBulkUpdate(BaseModel):
+    tasks: List[TaskStatusChange] = Field(..., min_length=1, max_length=TASKS_BULK_LIMIT)
+
 class LoginRequest(BaseModel):
     email: EmailStr
     password: str
 
-# Хеширование паролей
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+# Хеширование паролей (scrypt/PBKDF2 в отдельном пуле потоков, см. passwords.py)
+async def hash_password(password: str) -> str:
+    return await password_hasher.hash(password)
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await password_hasher.verify(password, hashed)
 
-def verify_password(password: str, hashed: str) -> bool:
-    return hash_password(password) == hashed
+# Время жизни сессии
+SESSION_LIFETIME = timedelta(days=7)
+# Скользящее продление сессии: не чаще одного раза в N минут (0 - выключено)
+SESSION_SLIDING_MINUTES = int(os.getenv("SESSION_SLIDING_MINUTES", "0"))
 
 # Создание сессии
 async def create_session_db(user_id: int, db: AsyncSession) -> str:
     session_id = secrets.token_urlsafe(32)
-    expires_at = datetime.utcnow() + timedelta(days=7)
+    expires_at = datetime.utcnow() + SESSION_LIFETIME
     
     db_session = SessionModel(
         session_id=session_id,
@@ -111,33 +154,78 @@ async def create_session_db(user_id: int, db: AsyncSession) -> str:
         expires_at=expires_at
     )
     db.add(db_session)
+    
+    # Лимит сессий на пользователя: вытесняем самые старые
+    evicted = []
+    if SESSION_MAX_PER_USER > 0:
+        await db.flush()
+        result = await db.execute(excess_sessions_statement(user_id, SESSION_MAX_PER_USER))
+        rows = result.all()
+        if rows:
+            await db.execute(delete(SessionModel).where(SessionModel.id.in_([row.id for row in rows])))
+            evicted = [row.session_id for row in rows]
+    
     await db.commit()
-    await db.refresh(db_session)
+    
+    for old_session_id in evicted:
+        await invalidate_session(old_session_id)
     
     return session_id
 
+# Продление сессии, если с прошлого продления прошло больше SESSION_SLIDING_MINUTES
+async def extend_session_db(session_id: str, expires_at: datetime, db: AsyncSession) -> datetime:
+    now = datetime.utcnow()
+    last_extended = expires_at - SESSION_LIFETIME
+    if now - last_extended < timedelta(minutes=SESSION_SLIDING_MINUTES):
+        return expires_at
+    
+    expires_at = now + SESSION_LIFETIME
+    await db.execute(
+        update(SessionModel)
+        .where(SessionModel.session_id == session_id)
+        .values(expires_at=expires_at)
+    )
+    await db.commit()
+    return expires_at
+
 # Получение текущего пользователя
 async def get_current_user(request: Request, db: AsyncSession = Depends(get_db)) -> Optional[UserModel]:
     session_id = request.cookies.get("session_id")
     if not session_id:
         return None
     
-    # Проверяем сессию в БД
+    # Пользователь уже найден в рамках этого запроса (например, в require_auth перед require_boss)
+    resolved = getattr(request.state, "current_user", None)
+    if resolved is not None and resolved[0] is db:
+        return resolved[1]
+    
+    # Сначала смотрим в кэш, чтобы не ходить в БД на каждый запрос
+    cached_user = session_cache.get(session_id)
+    if cached_user is not None:
+        user = await db.merge(cached_user, load=False)
+        request.state.current_user = (db, user)
+        return user
+    
+    # Находим сессию и пользователя одним запросом
     result = await db.execute(
-        select(SessionModel).where(
+        select(UserModel, SessionModel.expires_at)
+        .join(SessionModel, SessionModel.user_id == UserModel.id)
+        .where(
             SessionModel.session_id == session_id,
             SessionModel.expires_at > datetime.utcnow()
         )
     )
-    db_session = result.scalar_one_or_none()
+    row = result.first()
     
-    if not db_session:
+    if not row:
         return None
     
-    # Получаем пользователя
-    result = await db.execute(select(UserModel).where(UserModel.id == db_session.user_id))
-    user = result.scalar_one_or_none()
+    user, expires_at = row
+    if SESSION_SLIDING_MINUTES > 0:
+        expires_at = await extend_session_db(session_id, expires_at, db)
     
+    session_cache.set(session_id, user, expires_at)
+    request.state.current_user = (db, user)
     return user
 
 # Проверка авторизации
@@ -150,7 +238,7 @@ async def require_auth(request: Request, db: AsyncSession = Depends(get_db)) ->
         )
     return user
 
-# Проверка роли начальника
+# Проверка роли начальника (пользователь берется из уже выполненной проверки авторизации)
 async def require_boss(request: Request, db: AsyncSession = Depends(get_db)) -> UserModel:
     user = await require_auth(request, db)
     if user.role != Role.BOSS:
@@ -172,7 +260,7 @@ async def create_test_users(db: AsyncSession):
         boss = UserModel(
             username="admin",
             email="boss@valve.com",
-            password_hash=hash_password("admin123"),
+            password_hash=await hash_password("admin123"),
             role=Role.BOSS,
             avatar=None,
             description="Главный начальник компании Valve"
@@ -181,22 +269,33 @@ async def create_test_users(db: AsyncSession):
         await db.commit()
         await db.refresh(boss)
 
+# Страница для анонимного посетителя - одинаковая для всех, отдается из page_cache
+def anonymous_page(request: Request, name: str) -> Response:
+    return page_cache.response(request, name, lambda: templates.get_template(name).render(user=None))
+
+# Пользователь для публичных страниц: без cookie сессии не открываем сессию БД вовсе
+async def get_page_user(request: Request) -> Optional[UserModel]:
+    if not request.cookies.get("session_id"):
+        return None
+    async with AsyncSessionLocal() as db:
+        return await get_current_user(request, db)
+
 # Эндпоинты страниц
 @app.get("/")
 async def home(request: Request):
     """Главная страница о Valve"""
-    async with AsyncSessionLocal() as db:
-        user = await get_current_user(request, db)
-        user_dict = None
-        if user:
-            user_dict = {
-                "id": user.id,
-                "username": user.username,
-                "email": user.email,
-                "role": user.role,
-                "avatar": user.avatar,
-                "description": user.description
-            }
+    user = await get_page_user(request)
+    if not user:
+        return anonymous_page(request, "index.html")
+    
+    user_dict = {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "role": user.role,
+        "avatar": user.avatar,
+        "description": user.description
+    }
     return templates.TemplateResponse("index.html", {
         "request": request,
         "user": user_dict
@@ -205,20 +304,16 @@ async def home(request: Request):
 @app.get("/login")
 async def login_page(request: Request):
     """Страница авторизации"""
-    async with AsyncSessionLocal() as db:
-        user = await get_current_user(request, db)
-        if user:
-            return RedirectResponse(url="/profile", status_code=303)
-    return templates.TemplateResponse("login.html", {"request": request})
+    if await get_page_user(request):
+        return RedirectResponse(url="/profile", status_code=303)
+    return anonymous_page(request, "login.html")
 
 @app.get("/register")
 async def register_page(request: Request):
     """Страница регистрации"""
-    async with AsyncSessionLocal() as db:
-        user = await get_current_user(request, db)
-        if user:
-            return RedirectResponse(url="/profile", status_code=303)
-    return templates.TemplateResponse("register.html", {"request": request})
+    if await get_page_user(request):
+        return RedirectResponse(url="/profile", status_code=303)
+    return anonymous_page(request, "register.html")
 
 @app.get("/profile")
 async def profile_page(request: Request):
@@ -226,19 +321,12 @@ async def profile_page(request: Request):
     async with AsyncSessionLocal() as db:
         user = await require_auth(request, db)
         
-        # Получаем задачи пользователя
-        if user.role == Role.BOSS:
-            result = await db.execute(
-                select(TaskModel).where(TaskModel.created_by_id == user.id)
-                .options(selectinload(TaskModel.assignee))
-            )
-            user_tasks = result.scalars().all()
-        else:
-            result = await db.execute(
-                select(TaskModel).where(TaskModel.assigned_to_id == user.id)
-                .options(selectinload(TaskModel.creator))
-            )
-            user_tasks = result.scalars().all()
+        # Первая страница задач и счетчики; остальное страница догружает через /api/tasks
+        conditions = task_conditions(user)
+        user_tasks = await load_tasks_page(db, user, conditions, limit=TASKS_PAGE_SIZE + 1)
+        has_more = len(user_tasks) > TASKS_PAGE_SIZE
+        user_tasks = user_tasks[:TASKS_PAGE_SIZE]
+        task_counts = await count_tasks_by_status(db, conditions)
         
         user_dict = {
             "id": user.id,
@@ -249,22 +337,14 @@ async def profile_page(request: Request):
             "description": user.description
         }
         
-        tasks_list = []
-        for task in user_tasks:
-            tasks_list.append({
-                "id": task.id,
-                "title": task.title,
-                "description": task.description,
-                "status": task.status,
-                "created_by_id": task.created_by_id,
-                "assigned_to_id": task.assigned_to_id,
-                "created_at": task.created_at
-            })
+        tasks_list = [task_to_dict(task, user) for task in user_tasks]
     
     return templates.TemplateResponse("profile.html", {
         "request": request,
         "user": user_dict,
-        "tasks": tasks_list
+        "tasks": tasks_list,
+        "task_counts": task_counts,
+        "has_more_tasks": has_more
     })
 
 # API эндпоинты
@@ -284,7 +364,7 @@ async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     new_user = UserModel(
         username=user_data.username,
         email=user_data.email,
-        password_hash=hash_password(user_data.password),
+        password_hash=await hash_password(user_data.password),
         role=user_data.role.value,
         avatar=user_data.avatar,
         description=user_data.description
@@ -292,7 +372,6 @@ async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     
     db.add(new_user)
     await db.commit()
-    await db.refresh(new_user)
     
     # Создаем сессию
     session_id = await create_session_db(new_user.id, db)
@@ -316,9 +395,14 @@ async def login(credentials: LoginRequest, db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(UserModel).where(UserModel.email == credentials.email))
     user = result.scalar_one_or_none()
     
-    if not user or not verify_password(credentials.password, user.password_hash):
+    if not user or not await verify_password(credentials.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Неверный email или пароль")
     
+    # Старый хэш (sha256 без соли или слабые параметры) пересчитываем, пока знаем пароль.
+    # Сохранится вместе с сессией
+    if needs_rehash(user.password_hash):
+        user.password_hash = await hash_password(credentials.password)
+    
     # Создаем сессию
     session_id = await create_session_db(user.id, db)
     
@@ -340,6 +424,7 @@ async def logout(request: Request, db: AsyncSession = Depends(get_db)):
     """Выход из системы"""
     session_id = request.cookies.get("session_id")
     if session_id:
+        await invalidate_session(session_id)
         await db.execute(
             delete(SessionModel).where(SessionModel.session_id == session_id)
         )
@@ -356,14 +441,15 @@ async def get_current_user_api(request: Request, db: AsyncSession = Depends(get_
     if not user:
         raise HTTPException(status_code=401, detail="Не авторизован")
     
-    return {
+    etag, last_modified = rows_validators([user])
+    return conditional_response(request, etag, last_modified, lambda: {
         "id": user.id,
         "username": user.username,
         "email": user.email,
         "role": user.role,
         "avatar": user.avatar,
         "description": user.description
-    }
+    })
 
 @app.post("/api/upload-avatar")
 async def upload_avatar(file: UploadFile = File(...), request: Request = None, db: AsyncSession = Depends(get_db)):
@@ -371,30 +457,24 @@ async def upload_avatar(file: UploadFile = File(...), request: Request = None, d
     user = await require_auth(request, db)
     
     # Проверяем тип файла
-    if not file.content_type.startswith('image/'):
+    if detect_media_type(file.content_type) != "image":
         raise HTTPException(status_code=400, detail="Файл должен быть изображением")
     
-    # Генерируем уникальное имя файла
-    file_ext = os.path.splitext(file.filename)[1]
-    filename = f"{user.id}_{secrets.token_urlsafe(8)}{file_ext}"
-    filepath = os.path.join("uploads/avatars", filename)
-    
-    # Сохраняем файл
-    with open(filepath, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
-    
-    # Удаляем старый аватар если есть
-    if user.avatar and user.avatar.startswith("/uploads/avatars/"):
-        old_filepath = user.avatar.replace("/uploads/", "uploads/")
-        if os.path.exists(old_filepath):
-            os.remove(old_filepath)
+    # Сохраняем файл по частям (одинаковые файлы хранятся один раз)
+    avatar_url, _ = await save_upload(db, file, UPLOAD_LIMITS["avatar"])
     
     # Обновляем путь к аватару в БД
-    avatar_url = f"/uploads/avatars/{filename}"
+    old_avatar = user.avatar
     user.avatar = avatar_url
     await db.commit()
-    await db.refresh(user)
+    await invalidate_user(user.id)
+    
+    # Старый аватар удаляется, только если на этот файл больше никто не ссылается
+    # (при повторной загрузке того же файла так снимается лишняя ссылка)
+    await release_upload(db, old_avatar)
+    
+    # Приводим аватарку к единому размеру в фоне
+    media_processor.schedule_avatar(user.id, avatar_url)
     
     return {
         "avatar": avatar_url,
@@ -422,7 +502,7 @@ async def update_user(user_update: UserUpdate, request: Request, db: AsyncSessio
         user.description = user_update.description
     
     await db.commit()
-    await db.refresh(user)
+    await invalidate_user(user.id)
     
     return {
         "id": user.id,
@@ -433,25 +513,52 @@ async def update_user(user_update: UserUpdate, request: Request, db: AsyncSessio
         "description": user.description
     }
 
+# Максимум пользователей в одном запросе /api/users?ids=
+USERS_BULK_LIMIT = 100
+
+# Данные пользователя для /api/users и /api/user/{id}
+def user_public(user: UserModel) -> dict:
+    return {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "avatar": user.avatar,
+        "description": user.description
+    }
+
 @app.get("/api/users")
-async def get_users(request: Request, db: AsyncSession = Depends(get_db)):
-    """Получить список пользователей (для начальника)"""
+async def get_users(request: Request, ids: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """Получить список пользователей (для начальника) или несколько пользователей по id: ?ids=1,2,3"""
+    if ids is not None:
+        return await get_users_by_ids(ids, request, db)
+    
     user = await require_boss(request, db)
     
     # Возвращаем только подчиненных
     result = await db.execute(select(UserModel).where(UserModel.role == Role.EMPLOYEE))
     employees = result.scalars().all()
     
-    return [
-        {
-            "id": u.id,
-            "username": u.username,
-            "email": u.email,
-            "avatar": u.avatar,
-            "description": u.description
-        }
-        for u in employees
-    ]
+    etag, _ = rows_validators(employees, "employees")
+    return conditional_response(request, etag, None, lambda: [user_public(u) for u in employees])
+
+# Пакетная загрузка пользователей одним запросом вместо /api/user/{id} на каждого
+async def get_users_by_ids(ids: str, request: Request, db: AsyncSession):
+    await require_auth(request, db)
+    
+    try:
+        user_ids = {int(part) for part in ids.split(",") if part.strip()}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids должен быть списком чисел через запятую")
+    if len(user_ids) > USERS_BULK_LIMIT:
+        raise HTTPException(status_code=400, detail=f"Не больше {USERS_BULK_LIMIT} пользователей за запрос")
+    if not user_ids:
+        return []
+    
+    result = await db.execute(select(UserModel).where(UserModel.id.in_(user_ids)).order_by(UserModel.id))
+    users = result.scalars().all()
+    
+    etag, _ = rows_validators(users, "ids")
+    return conditional_response(request, etag, None, lambda: [user_public(u) for u in users])
 
 @app.get("/api/user/{user_id}")
 async def get_user_by_id(user_id: int, request: Request, db: AsyncSession = Depends(get_db)):
@@ -464,14 +571,70 @@ async def get_user_by_id(user_id: int, request: Request, db: AsyncSession = Depe
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
+    etag, last_modified = rows_validators([user])
+    return conditional_response(request, etag, last_modified, lambda: user_public(user))
+
+# Краткие данные пользователя для вложения в ответы
+def user_brief(user: Optional[UserModel]) -> Optional[dict]:
+    if user is None:
+        return None
+    return {"id": user.id, "username": user.username, "avatar": user.avatar}
+
+def task_fields(task: TaskModel) -> dict:
     return {
-        "id": user.id,
-        "username": user.username,
-        "email": user.email,
-        "avatar": user.avatar,
-        "description": user.description
+        "id": task.id,
+        "title": task.title,
+        "description": task.description,
+        "created_by_id": task.created_by_id,
+        "assigned_to_id": task.assigned_to_id,
+        "status": task.status,
+        "created_at": task.created_at
     }
 
+# Задача для ответа API. Начальнику вкладываем исполнителя, подчиненному - автора,
+# чтобы клиенту не нужно было запрашивать пользователей по одному
+def task_to_dict(task: TaskModel, viewer: UserModel) -> dict:
+    data = task_fields(task)
+    if viewer.role == Role.BOSS:
+        data["assignee"] = user_brief(task.assignee)
+    else:
+        data["creator"] = user_brief(task.creator)
+    return data
+
+# Сколько задач помещаем в одно событие (кадр рассылки между воркерами ограничен 1 МБ)
+TASK_EVENT_CHUNK = 100
+
+# События задач рассылаются во все воркеры, каждый отдает их соединениям /ws/tasks адресата
+async def publish_task_events(event_type: str, items_by_user: dict):
+    for user_id, items in items_by_user.items():
+        for start in range(0, len(items), TASK_EVENT_CHUNK):
+            await broadcast.publish("tasks", {
+                "user_id": user_id,
+                "event": {"type": event_type, "tasks": items[start:start + TASK_EVENT_CHUNK]}
+            })
+
+# Новые задачи: автору - с исполнителем, исполнителю - с автором (как в /api/tasks)
+async def publish_tasks_created(tasks: list, creator: UserModel, assignees: dict):
+    items_by_user = {}
+    for task in tasks:
+        fields = jsonable_encoder(task_fields(task))
+        items_by_user.setdefault(creator.id, []).append(
+            {**fields, "assignee": user_brief(assignees[task.assigned_to_id])}
+        )
+        items_by_user.setdefault(task.assigned_to_id, []).append(
+            {**fields, "creator": user_brief(creator)}
+        )
+    await publish_task_events("tasks_created", items_by_user)
+
+# Изменения статуса - только разница: id, новый и прежний статус (для пересчета счетчиков на клиенте)
+async def publish_tasks_updated(changes: list):
+    items_by_user = {}
+    for task, previous_status in changes:
+        diff = {"id": task.id, "status": task.status, "previous_status": previous_status}
+        for user_id in {task.created_by_id, task.assigned_to_id}:
+            items_by_user.setdefault(user_id, []).append(diff)
+    await publish_task_events("tasks_updated", items_by_user)
+
 @app.post("/api/tasks")
 async def create_task(task_data: TaskCreate, request: Request, db: AsyncSession = Depends(get_db)):
     """Создать задачу (только для начальника)"""
@@ -496,7 +659,8 @@ async def create_task(task_data: TaskCreate, request: Request, db: AsyncSession
     
     db.add(new_task)
     await db.commit()
-    await db.refresh(new_task)
+    
+    await publish_tasks_created([new_task], user, {assigned_user.id: assigned_user})
     
     return {
         "id": new_task.id,
@@ -505,39 +669,210 @@ async def create_task(task_data: TaskCreate, request: Request, db: AsyncSession
         "created_by_id": new_task.created_by_id,
         "assigned_to_id": new_task.assigned_to_id,
         "status": new_task.status,
-        "created_at": new_task.created_at
+        "created_at": new_task.created_at,
+        "assignee": user_brief(assigned_user)
     }
 
+# Размер страницы задач в личном кабинете
+TASKS_PAGE_SIZE = 20
+
+# Даты в БД хранятся в UTC без часового пояса
+def to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+# Условия выборки задач пользователя (кроме статуса - по нему считаются счетчики)
+def task_conditions(
+    user: UserModel,
+    assigned_to_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None
+) -> list:
+    if user.role == Role.BOSS:
+        conditions = [TaskModel.created_by_id == user.id]
+    else:
+        conditions = [TaskModel.assigned_to_id == user.id]
+    if assigned_to_id is not None:
+        conditions.append(TaskModel.assigned_to_id == assigned_to_id)
+    if created_from is not None:
+        conditions.append(TaskModel.created_at >= to_naive_utc(created_from))
+    if created_to is not None:
+        conditions.append(TaskModel.created_at < to_naive_utc(created_to))
+    return conditions
+
+# Страница задач: пагинация по id (индексы (created_by_id, id) и (assigned_to_id, id)) без OFFSET
+async def load_tasks_page(
+    db: AsyncSession,
+    user: UserModel,
+    conditions: list,
+    status: Optional[str] = None,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    order: str = "desc",
+    limit: int = TASKS_PAGE_SIZE
+) -> list:
+    query = select(TaskModel).where(*conditions)
+    if status is not None:
+        query = query.where(TaskModel.status == status)
+    if before_id is not None:
+        query = query.where(TaskModel.id < before_id)
+    if after_id is not None:
+        query = query.where(TaskModel.id > after_id)
+    
+    counterpart = TaskModel.assignee if user.role == Role.BOSS else TaskModel.creator
+    result = await db.execute(
+        query.options(selectinload(counterpart))
+        .order_by(TaskModel.id.desc() if order == "desc" else TaskModel.id.asc())
+        .limit(limit)
+    )
+    return result.scalars().all()
+
+# Количество задач по статусам одним GROUP BY
+async def count_tasks_by_status(db: AsyncSession, conditions: list) -> dict:
+    result = await db.execute(
+        select(TaskModel.status, func.count(TaskModel.id))
+        .where(*conditions)
+        .group_by(TaskModel.status)
+    )
+    counts = {status.value: 0 for status in TaskStatusEnum}
+    counts.update({status: count for status, count in result.all()})
+    counts["total"] = sum(counts.values())
+    return counts
+
 @app.get("/api/tasks")
-async def get_tasks(request: Request, db: AsyncSession = Depends(get_db)):
-    """Получить задачи пользователя"""
+async def get_tasks(
+    request: Request,
+    status: Optional[TaskStatusEnum] = None,
+    assigned_to_id: Optional[int] = None,
+    created_from: Optional[datetime] = Query(None, description="Созданные не раньше (ISO 8601)"),
+    created_to: Optional[datetime] = Query(None, description="Созданные раньше (ISO 8601)"),
+    before_id: Optional[int] = Query(None, description="Задачи с id меньше (следующая страница при order=desc)"),
+    after_id: Optional[int] = Query(None, description="Задачи с id больше (следующая страница при order=asc)"),
+    order: str = Query("desc", pattern="^(asc|desc)$", description="desc - сначала новые, asc - сначала старые"),
+    limit: int = Query(TASKS_PAGE_SIZE, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    """Получить задачи пользователя постранично"""
     user = await require_auth(request, db)
     
-    if user.role == Role.BOSS:
-        result = await db.execute(
-            select(TaskModel).where(TaskModel.created_by_id == user.id)
-            .options(selectinload(TaskModel.assignee))
-        )
-    else:
-        result = await db.execute(
-            select(TaskModel).where(TaskModel.assigned_to_id == user.id)
-            .options(selectinload(TaskModel.creator))
-        )
+    conditions = task_conditions(user, assigned_to_id, created_from, created_to)
+    tasks = await load_tasks_page(
+        db, user, conditions,
+        status=status.value if status else None,
+        before_id=before_id, after_id=after_id, order=order, limit=limit
+    )
     
-    tasks = result.scalars().all()
-    
-    return [
-        {
-            "id": t.id,
-            "title": t.title,
-            "description": t.description,
-            "created_by_id": t.created_by_id,
-            "assigned_to_id": t.assigned_to_id,
-            "status": t.status,
-            "created_at": t.created_at
-        }
-        for t in tasks
+    # Версия ответа - версии задач и вложенных пользователей (имя или аватарка могли смениться)
+    counterparts = [t.assignee if user.role == Role.BOSS else t.creator for t in tasks]
+    etag, _ = rows_validators([*tasks, *counterparts], user.id)
+    return conditional_response(request, etag, None, lambda: [task_to_dict(t, user) for t in tasks])
+
+@app.get("/api/tasks/counts")
+async def get_task_counts(
+    request: Request,
+    assigned_to_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Количество задач пользователя по статусам (с теми же фильтрами, что и /api/tasks)"""
+    user = await require_auth(request, db)
+    return await count_tasks_by_status(db, task_conditions(user, assigned_to_id, created_from, created_to))
+
+# Пакетные эндпоинты объявлены до /api/tasks/{task_id}, иначе "bulk" попадет в task_id
+@app.post("/api/tasks/bulk")
+async def create_tasks_bulk(data: TaskBulkCreate, request: Request, db: AsyncSession = Depends(get_db)):
+    """Создать несколько задач одной транзакцией (только для начальника).
+    
+    Задачи с ошибками пропускаются и перечисляются в errors с индексом в запросе,
+    остальные создаются.
+    """
+    user = await require_boss(request, db)
+    
+    # Все исполнители одним запросом
+    assignee_ids = {item.assigned_to_id for item in data.tasks}
+    result = await db.execute(select(UserModel).where(UserModel.id.in_(assignee_ids)))
+    assignees = {u.id: u for u in result.scalars().all()}
+    
+    new_tasks = []
+    errors = []
+    for index, item in enumerate(data.tasks):
+        assignee = assignees.get(item.assigned_to_id)
+        if not assignee:
+            errors.append({"index": index, "detail": "Пользователь не найден"})
+            continue
+        if assignee.role != Role.EMPLOYEE:
+            errors.append({"index": index, "detail": "Можно назначать задачи только подчиненным"})
+            continue
+        new_tasks.append(TaskModel(
+            title=item.title,
+            description=item.description,
+            created_by_id=user.id,
+            assigned_to_id=assignee.id,
+            assignee=assignee,
+            status=TaskStatus.PENDING
+        ))
+    
+    if new_tasks:
+        db.add_all(new_tasks)
+        await db.commit()
+        await publish_tasks_created(new_tasks, user, assignees)
+    
+    return {
+        "created": [task_to_dict(task, user) for task in new_tasks],
+        "errors": errors
+    }
+
+@app.patch("/api/tasks/bulk")
+async def update_tasks_bulk(data: TaskBulkUpdate, request: Request, db: AsyncSession = Depends(get_db)):
+    """Изменить статус нескольких задач одной транзакцией.
+    
+    Права проверяются для каждой задачи, как в PATCH /api/tasks/{task_id};
+    задачи, которые изменить нельзя, перечисляются в errors.
+    """
+    user = await require_auth(request, db)
+    
+    counterpart = TaskModel.assignee if user.role == Role.BOSS else TaskModel.creator
+    result = await db.execute(
+        select(TaskModel)
+        .where(TaskModel.id.in_({item.id for item in data.tasks}))
+        .options(selectinload(counterpart))
+    )
+    tasks = {t.id: t for t in result.scalars().all()}
+    
+    updated = {}
+    # Статус до запроса: одна задача может встретиться в запросе несколько раз,
+    # событие же должно быть одно - от исходного статуса к последнему
+    previous_statuses = {}
+    errors = []
+    for index, item in enumerate(data.tasks):
+        task = tasks.get(item.id)
+        if not task:
+            errors.append({"index": index, "id": item.id, "detail": "Задача не найдена"})
+            continue
+        owner_id = task.created_by_id if user.role == Role.BOSS else task.assigned_to_id
+        if owner_id != user.id:
+            errors.append({"index": index, "id": item.id, "detail": "Недостаточно прав"})
+            continue
+        previous_statuses.setdefault(task.id, task.status)
+        task.status = item.status.value
+        updated[task.id] = task
+    
+    changes = [
+        (task, previous_statuses[task.id])
+        for task in updated.values()
+        if task.status != previous_statuses[task.id]
     ]
+    if updated:
+        await db.commit()
+    if changes:
+        await publish_tasks_updated(changes)
+    
+    return {
+        "updated": [task_to_dict(task, user) for task in updated.values()],
+        "errors": errors
+    }
 
 @app.patch("/api/tasks/{task_id}")
 async def update_task(task_id: int, task_update: TaskUpdate, request: Request, db: AsyncSession = Depends(get_db)):
@@ -550,6 +885,8 @@ async def update_task(task_id: int, task_update: TaskUpdate, request: Request, d
     if not task:
         raise HTTPException(status_code=404, detail="Задача не найдена")
     
+    previous_status = task.status
+    
     # Подчиненный может менять только статус своих задач
     if user.role == Role.EMPLOYEE:
         if task.assigned_to_id != user.id:
@@ -565,7 +902,9 @@ async def update_task(task_id: int, task_update: TaskUpdate, request: Request, d
             task.status = task_update.status.value
     
     await db.commit()
-    await db.refresh(task)
+    
+    if task.status != previous_status:
+        await publish_tasks_updated([(task, previous_status)])
     
     return {
         "id": task.id,
@@ -577,9 +916,6 @@ async def update_task(task_id: int, task_update: TaskUpdate, request: Request, d
         "created_at": task.created_at
     }
 
-# WebSocket соединения для чата
-active_connections: List[WebSocket] = []
-
 @app.get("/chat")
 async def chat_page(request: Request):
     """Страница чата"""
@@ -597,55 +933,148 @@ async def chat_page(request: Request):
     
     return templates.TemplateResponse("chat.html", {
         "request": request,
-        "user": user_dict
+        "user": user_dict,
+        "message_max_chars": CHAT_MESSAGE_MAX_CHARS
     })
 
 @app.get("/games")
 async def games_page(request: Request):
     """Страница с играми"""
-    async with AsyncSessionLocal() as db:
-        user = await get_current_user(request, db)
-        user_dict = None
-        if user:
-            user_dict = {
-                "id": user.id,
-                "username": user.username,
-                "email": user.email,
-                "role": user.role,
-                "avatar": user.avatar,
-                "description": user.description
-            }
+    user = await get_page_user(request)
+    if not user:
+        return anonymous_page(request, "games.html")
     
+    user_dict = {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "role": user.role,
+        "avatar": user.avatar,
+        "description": user.description
+    }
     return templates.TemplateResponse("games.html", {
         "request": request,
         "user": user_dict
     })
 
+# Сообщение чата в виде, в котором его получают клиенты
+def message_to_dict(message: MessageModel, user: UserModel) -> dict:
+    return {
+        "id": message.id,
+        "user_id": user.id,
+        "username": user.username,
+        "avatar": user.avatar,
+        "content": message.content,
+        "message_type": message.message_type,
+        "file_path": message.file_path,
+        "thumbnail_path": message.thumbnail_path,
+        "created_at": message.created_at.isoformat()
+    }
+
+# Пользователь WebSocket-соединения: берется из кэша сессий, в БД идем только при промахе
+async def get_websocket_user(websocket: WebSocket) -> Optional[UserModel]:
+    async with AsyncSessionLocal() as db:
+        return await get_current_user(websocket, db)
+
+# Сохранение текстового сообщения, пришедшего по WebSocket, и подтверждение отправителю
+async def save_websocket_message(connection: ChatConnection, user: UserModel, content: str, client_id):
+    try:
+        message = await message_writer.submit(MessageModel(
+            user_id=user.id,
+            content=content,
+            message_type="text"
+        ))
+    except Exception as e:
+        print(f"Ошибка сохранения сообщения: {e}")
+        connection.send_json({"type": "error", "client_id": client_id, "detail": "Ошибка отправки сообщения"})
+        return
+    
+    connection.send_json({"type": "ack", "client_id": client_id, "id": message.id})
+    await broadcast.publish("chat", message_to_dict(message, user))
+
 @app.websocket("/ws/chat")
 async def websocket_chat(websocket: WebSocket):
     """WebSocket эндпоинт для чата"""
-    await websocket.accept()
-    active_connections.append(websocket)
+    # Авторизация один раз при подключении по cookie session_id
+    if not await get_websocket_user(websocket):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    connection = await chat_connections.connect(websocket)
+    pending = set()
     
     try:
         while True:
-            # Ждем сообщения от клиента (для ping/pong или других команд)
             data = await websocket.receive_json()
+            if not isinstance(data, dict):
+                connection.send_json({"type": "error", "detail": "Некорректное сообщение"})
+                continue
             # Обрабатываем ping/pong для поддержания соединения
             if data.get('type') == 'ping':
-                await websocket.send_json({'type': 'pong'})
-            # Основные сообщения отправляются через HTTP POST и рассылаются сервером
+                connection.send_json({'type': 'pong'})
+            # Текстовое сообщение: {"type": "message", "content": "...", "client_id": "..."}
+            elif data.get('type') == 'message':
+                client_id = data.get('client_id')
+                content = data.get('content') or ''
+                if not isinstance(content, str):
+                    connection.send_json({"type": "error", "client_id": client_id, "detail": "Текст сообщения должен быть строкой"})
+                    continue
+                content = content.strip()
+                if not content:
+                    connection.send_json({"type": "error", "client_id": client_id, "detail": "Пустое сообщение"})
+                    continue
+                if len(content) > CHAT_MESSAGE_MAX_CHARS:
+                    connection.send_json({
+                        "type": "error",
+                        "client_id": client_id,
+                        "detail": f"Сообщение длиннее {CHAT_MESSAGE_MAX_CHARS} символов"
+                    })
+                    continue
+                
+                # При попадании в кэш сессий запроса к БД нет; заодно подхватываем выход и смену профиля
+                user = await get_websocket_user(websocket)
+                if not user:
+                    connection.send_json({"type": "error", "client_id": client_id, "detail": "Требуется авторизация"})
+                    break
+                
+                task = asyncio.create_task(save_websocket_message(connection, user, content, client_id))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            # Файлы по-прежнему отправляются через HTTP POST
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"WebSocket ошибка: {e}")
+    finally:
+        chat_connections.disconnect(connection)
+
+@app.websocket("/ws/tasks")
+async def websocket_tasks(websocket: WebSocket):
+    """WebSocket эндпоинт для событий задач пользователя (tasks_created, tasks_updated)"""
+    user = await get_websocket_user(websocket)
+    if not user:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    user_id = user.id
+    connection = await task_connections.connect(websocket, user_id)
+    
+    try:
+        # От клиента ждем только ping - события идут в одну сторону
+        while True:
+            data = await websocket.receive_json()
+            if data.get('type') == 'ping':
+                connection.send_json({'type': 'pong'})
     except WebSocketDisconnect:
-        if websocket in active_connections:
-            active_connections.remove(websocket)
+        pass
     except Exception as e:
         print(f"WebSocket ошибка: {e}")
-        if websocket in active_connections:
-            active_connections.remove(websocket)
+    finally:
+        task_connections.disconnect(user_id, connection)
 
 @app.post("/api/chat/message")
 async def send_message(
-    content: Optional[str] = Form(None),
+    content: Optional[str] = Form(None, max_length=CHAT_MESSAGE_MAX_CHARS),
     file: Optional[UploadFile] = File(None),
     request: Request = None,
     db: AsyncSession = Depends(get_db)
@@ -659,32 +1088,12 @@ async def send_message(
     
     if file:
         # Определяем тип файла
-        if file.content_type.startswith('image/'):
-            message_type = "image"
-            folder = "chat/images"
-        elif file.content_type.startswith('video/'):
-            message_type = "video"
-            folder = "chat/videos"
-        elif file.content_type.startswith('audio/'):
-            message_type = "audio"
-            folder = "chat/audio"
-        else:
+        message_type = detect_media_type(file.content_type)
+        if not message_type:
             raise HTTPException(status_code=400, detail="Неподдерживаемый тип файла")
         
-        # Создаем папку если не существует
-        os.makedirs(f"uploads/{folder}", exist_ok=True)
-        
-        # Сохраняем файл
-        file_ext = os.path.splitext(file.filename)[1]
-        filename = f"{user.id}_{secrets.token_urlsafe(8)}_{int(datetime.now().timestamp())}{file_ext}"
-        file_path_save = os.path.join(f"uploads/{folder}", filename)
-        
-        # Читаем и сохраняем файл
-        content_file = await file.read()
-        with open(file_path_save, "wb") as buffer:
-            buffer.write(content_file)
-        
-        file_path = f"/uploads/{folder}/{filename}"
+        # Сохраняем файл по частям с проверкой размера (одинаковые файлы хранятся один раз)
+        file_path, _ = await save_upload(db, file, UPLOAD_LIMITS[message_type])
     
     # Создаем сообщение в БД
     message = MessageModel(
@@ -694,70 +1103,200 @@ async def send_message(
         file_path=file_path
     )
     
+    # id и created_at заполняются при вставке; объекты не сбрасываются после commit (expire_on_commit=False),
+    # поэтому ни refresh, ни повторная выборка пользователя не нужны
     db.add(message)
     await db.commit()
-    await db.refresh(message)
     
-    # Получаем информацию о пользователе
-    result = await db.execute(select(UserModel).where(UserModel.id == user.id))
-    user_obj = result.scalar_one_or_none()
+    # Миниатюру или кадр-превью готовим в фоне, клиенты получат ее отдельным событием
+    if file_path:
+        media_processor.schedule_chat_media(message.id, message_type, file_path)
     
     # Отправляем через WebSocket всем подключенным
-    message_data = {
-        "id": message.id,
-        "user_id": user.id,
-        "username": user_obj.username,
-        "avatar": user_obj.avatar,
-        "content": message.content,
-        "message_type": message.message_type,
-        "file_path": message.file_path,
-        "created_at": message.created_at.isoformat()
-    }
+    message_data = message_to_dict(message, user)
     
-    # Отправляем всем подключенным клиентам (включая отправителя для синхронизации)
-    for connection in active_connections:
-        try:
-            await connection.send_json(message_data)
-        except:
-            # Если соединение закрыто, удаляем его из списка
-            if connection in active_connections:
-                active_connections.remove(connection)
+    # Отправляем всем подключенным клиентам во всех воркерах (включая отправителя для синхронизации)
+    await broadcast.publish("chat", message_data)
     
     return message_data
 
+# Прогрев буфера последних сообщений из БД
+async def warm_recent_messages(db: AsyncSession):
+    generation = recent_messages.start_warming()
+    try:
+        result = await db.execute(
+            select(MessageModel)
+            .options(selectinload(MessageModel.user))
+            .order_by(MessageModel.id.desc())
+            .limit(recent_messages.maxlen)
+        )
+        messages = list(reversed(result.scalars().all()))
+    except BaseException:
+        # Следующий запрос попробует прогреть буфер снова
+        recent_messages.abort_warming(generation)
+        raise
+    recent_messages.fill(
+        [message_to_dict(msg, msg.user) for msg in messages],
+        complete=len(messages) < recent_messages.maxlen,
+        generation=generation
+    )
+
 @app.get("/api/chat/messages")
-async def get_messages(request: Request, db: AsyncSession = Depends(get_db)):
-    """Получить сообщения чата"""
+async def get_messages(
+    request: Request,
+    before_id: Optional[int] = Query(None, description="Сообщения старше этого id (прокрутка истории вверх)"),
+    after_id: Optional[int] = Query(None, description="Сообщения новее этого id (догрузка после переподключения)"),
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_db)
+):
+    """Получить сообщения чата (всегда по возрастанию id)"""
     await require_auth(request, db)
     
-    result = await db.execute(
-        select(MessageModel)
-        .options(selectinload(MessageModel.user))
-        .order_by(MessageModel.created_at.desc())
-        .limit(50)
+    # Последние сообщения отдаем из буфера в памяти уже готовым JSON
+    if recent_messages.enabled:
+        if not recent_messages.warm and not recent_messages.warming:
+            await warm_recent_messages(db)
+        cached = recent_messages.get(before_id, after_id, limit)
+        if cached is not None:
+            return conditional_response(request, bytes_etag(cached), None, lambda: cached)
+    
+    # Пагинация по первичному ключу: поиск по индексу id без OFFSET
+    query = select(MessageModel).options(selectinload(MessageModel.user))
+    if before_id is not None:
+        query = query.where(MessageModel.id < before_id)
+    if after_id is not None:
+        query = query.where(MessageModel.id > after_id)
+    
+    if after_id is not None and before_id is None:
+        # Ближайшие сообщения после after_id, чтобы при большом разрыве догружать по порядку
+        result = await db.execute(query.order_by(MessageModel.id.asc()).limit(limit))
+        messages = result.scalars().all()
+    else:
+        # Последние limit сообщений (до before_id, если он задан)
+        result = await db.execute(query.order_by(MessageModel.id.desc()).limit(limit))
+        messages = list(reversed(result.scalars().all()))
+    
+    etag, _ = rows_validators([*messages, *(msg.user for msg in messages)])
+    return conditional_response(request, etag, None, lambda: [message_to_dict(msg, msg.user) for msg in messages])
+
+# Доступ к /metrics: если задан токен, Prometheus передает его в заголовке Authorization: Bearer
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+metrics.callback("websocket_connections", "Открытые WebSocket-соединения в этом воркере", lambda: [
+    ({"channel": "chat"}, len(chat_connections)),
+    ({"channel": "tasks"}, len(task_connections)),
+])
+metrics.callback("websocket_slow_clients_dropped_total", "Отключенные медленные WebSocket-клиенты", lambda: [
+    ({"channel": "chat"}, chat_connections.dropped),
+    ({"channel": "tasks"}, task_connections.dropped),
+], kind="counter")
+metrics.callback("cache_entries", "Записей в кэшах", lambda: [
+    ({"cache": "sessions"}, session_cache.stats()["size"]),
+    ({"cache": "recent_messages"}, recent_messages.stats()["size"]),
+    ({"cache": "pages"}, page_cache.stats()["size"]),
+])
+metrics.callback("cache_requests_total", "Обращения к кэшам", lambda: [
+    ({"cache": name, "result": result}, stats[result])
+    for name, stats in (
+        ("sessions", session_cache.stats()),
+        ("recent_messages", recent_messages.stats()),
+        ("pages", page_cache.stats()),
     )
-    messages = result.scalars().all()
-    
-    return [
-        {
-            "id": msg.id,
-            "user_id": msg.user_id,
-            "username": msg.user.username,
-            "avatar": msg.user.avatar,
-            "content": msg.content,
-            "message_type": msg.message_type,
-            "file_path": msg.file_path,
-            "created_at": msg.created_at.isoformat()
-        }
-        for msg in reversed(messages)
-    ]
+    for result in ("hits", "misses")
+], kind="counter")
+metrics.callback("recent_messages_bytes", "Размер буфера последних сообщений чата", lambda: recent_messages.stats()["bytes"])
+metrics.callback("sessions_reaped_total", "Удалено просроченных сессий", lambda: session_reaper.reaped, kind="counter")
+metrics.callback("static_assets_bytes", "Статика в памяти по кодировкам", lambda: [
+    ({"encoding": "identity"}, asset_manifest.stats()["bytes"]),
+    *(({"encoding": encoding}, size) for encoding, size in asset_manifest.stats()["compressed"].items()),
+])
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint(request: Request):
+    """Метрики текущего воркера в формате Prometheus"""
+    if METRICS_TOKEN:
+        authorization = request.headers.get("authorization", "")
+        if not secrets.compare_digest(authorization, f"Bearer {METRICS_TOKEN}"):
+            raise HTTPException(status_code=401, detail="Неверный токен метрик")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Поиск по истории чата
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_OFFSET = 1000
+
+@app.get("/api/chat/search")
+async def search_messages(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200, description="Слова для поиска, последнее - по началу слова"),
+    user_id: Optional[int] = Query(None, description="Только сообщения этого автора"),
+    created_from: Optional[datetime] = Query(None, description="Отправленные не раньше (ISO 8601)"),
+    created_to: Optional[datetime] = Query(None, description="Отправленные раньше (ISO 8601)"),
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=50),
+    offset: int = Query(0, ge=0, le=SEARCH_MAX_OFFSET),
+    db: AsyncSession = Depends(get_db)
+):
+    """Поиск сообщений по релевантности; snippet - фрагмент с совпадениями в <mark> (HTML уже экранирован)"""
+    await require_auth(request, db)
+    
+    terms = search_terms(q)
+    if not terms:
+        raise HTTPException(status_code=400, detail="В запросе нет слов для поиска")
+    
+    # Лишняя строка - признак следующей страницы
+    rows = await chat_search.search(
+        db, terms, limit + 1, offset,
+        user_id=user_id,
+        created_from=to_naive_utc(created_from),
+        created_to=to_naive_utc(created_to),
+    )
+    return {
+        "results": [
+            {**message_to_dict(message, message.user), "snippet": snippet}
+            for message, snippet in rows[:limit]
+        ],
+        "offset": offset,
+        "limit": limit,
+        "has_more": len(rows) > limit
+    }
 
 @app.on_event("startup")
 async def startup_event():
     """Инициализация БД и создание тестового пользователя при запуске"""
+    print(f"Настройки БД: {engine_report()}")
+    asset_manifest.build()
+    print(f"Статика: {asset_manifest.stats()}")
+    # Компилируем шаблоны заранее, чтобы первые посетители не ждали; в готовых страницах - новые ссылки на статику
+    for name in templates.env.list_templates():
+        templates.get_template(name)
+    page_cache.clear()
     await init_db()
     async with AsyncSessionLocal() as db:
         await create_test_users(db)
+        await chat_search.detect(db)
+    print(f"Поиск по чату: {chat_search.backend}")
+    
+    broadcast.subscribe("chat", chat_connections.send_to_all)
+    broadcast.subscribe("chat", recent_messages.on_chat_event)
+    broadcast.subscribe("tasks", task_connections.on_event)
+    broadcast.subscribe("invalidate", on_invalidate)
+    broadcast.on_reset(on_broadcast_reset)
+    await broadcast.start()
+    await message_writer.start()
+    await session_reaper.start()
+    
+    if recent_messages.enabled:
+        async with AsyncSessionLocal() as db:
+            await warm_recent_messages(db)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Сохранение оставшихся сообщений и остановка фоновых задач"""
+    await session_reaper.stop()
+    await message_writer.stop()
+    await media_processor.stop()
+    password_hasher.stop()
+    await broadcast.stop()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,179 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Set
+import asyncio
+import os
+import shutil
+
+from sqlalchemy import update
+
+from database import AsyncSessionLocal
+from models import User as UserModel, Message as MessageModel
+from broadcast import broadcast
+from cache import invalidate_user
+from uploads import UPLOAD_DIR, MEDIA_DIR, url_to_path, new_tmp_path, hash_file, store_blob, release_upload
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Без Pillow миниатюры не создаются, файлы отдаются как есть
+    Image = None
+
+# Сколько файлов обрабатываем одновременно
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "2"))
+# Максимальная сторона миниатюры в чате и размер аватарки
+MEDIA_THUMB_SIZE = int(os.getenv("MEDIA_THUMB_SIZE", "480"))
+MEDIA_AVATAR_SIZE = int(os.getenv("MEDIA_AVATAR_SIZE", "256"))
+# Миниатюры называются по хэшу оригинала, поэтому тоже неизменяемы
+MEDIA_THUMB_DIR = f"{MEDIA_DIR}/thumbs"
+# ffmpeg нужен только для кадров-превью видео
+FFMPEG = shutil.which("ffmpeg")
+
+
+def thumb_format() -> str:
+    return "webp" if features.check("webp") else "jpeg"
+
+
+# Уменьшенная копия изображения (выполняется в пуле потоков - Pillow отпускает GIL)
+def make_thumbnail(src: str, dst: str, size: int, square: bool = False):
+    with Image.open(src) as img:
+        img.draft("RGB", (size, size))
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+        if square:
+            img = ImageOps.fit(img, (size, size), Image.LANCZOS)
+        else:
+            img.thumbnail((size, size), Image.LANCZOS)
+
+        fmt = thumb_format()
+        if fmt == "jpeg" and img.mode == "RGBA":
+            img = img.convert("RGB")
+        tmp = dst + ".part"
+        img.save(tmp, fmt, quality=80)
+    os.replace(tmp, dst)
+
+
+class MediaProcessor:
+    """Фоновая обработка загруженных файлов: миниатюры, аватарки, превью видео"""
+
+    def __init__(self, workers: int = MEDIA_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_in_pool(self, func, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="media")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def schedule_chat_media(self, message_id: int, message_type: str, file_url: str):
+        if self.enabled and message_type in ("image", "video"):
+            self._spawn(self._process_chat_media(message_id, message_type, file_url))
+
+    def schedule_avatar(self, user_id: int, avatar_url: str):
+        if self.enabled and Image is not None:
+            self._spawn(self._process_avatar(user_id, avatar_url))
+
+    async def _process_chat_media(self, message_id: int, message_type: str, file_url: str):
+        src = url_to_path(file_url)
+        name = os.path.splitext(os.path.basename(src))[0]
+        os.makedirs(os.path.join(UPLOAD_DIR, MEDIA_THUMB_DIR), exist_ok=True)
+
+        try:
+            if message_type == "image":
+                if Image is None:
+                    return
+                thumb_url = f"/{UPLOAD_DIR}/{MEDIA_THUMB_DIR}/{name}.{thumb_format()}"
+                # Этот файл уже загружали - миниатюра готова
+                if not os.path.exists(url_to_path(thumb_url)):
+                    await self._run_in_pool(make_thumbnail, src, url_to_path(thumb_url), MEDIA_THUMB_SIZE)
+            else:
+                if FFMPEG is None:
+                    return
+                thumb_url = f"/{UPLOAD_DIR}/{MEDIA_THUMB_DIR}/{name}.jpg"
+                if not os.path.exists(url_to_path(thumb_url)) and not await self._make_video_poster(src, url_to_path(thumb_url)):
+                    return
+        except Exception as e:
+            print(f"Не удалось создать миниатюру для {file_url}: {e}")
+            return
+
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(MessageModel)
+                .where(MessageModel.id == message_id)
+                .values(thumbnail_path=thumb_url)
+            )
+            await db.commit()
+
+        # Клиенты подменяют полноразмерный файл на миниатюру
+        await broadcast.publish("chat", {
+            "type": "message_update",
+            "id": message_id,
+            "thumbnail_path": thumb_url
+        })
+
+    async def _make_video_poster(self, src: str, dst: str) -> bool:
+        process = await asyncio.create_subprocess_exec(
+            FFMPEG, "-y", "-loglevel", "error",
+            "-ss", "1", "-i", src,
+            "-frames:v", "1",
+            "-vf", f"scale='min({MEDIA_THUMB_SIZE},iw)':-2",
+            dst,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        return await process.wait() == 0 and os.path.exists(dst)
+
+    async def _process_avatar(self, user_id: int, avatar_url: str):
+        tmp_path = new_tmp_path()
+        try:
+            await self._run_in_pool(make_thumbnail, url_to_path(avatar_url), tmp_path, MEDIA_AVATAR_SIZE, True)
+            sha256, size = await asyncio.to_thread(hash_file, tmp_path)
+        except Exception as e:
+            print(f"Не удалось обработать аватарку {avatar_url}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        async with AsyncSessionLocal() as db:
+            ext = ".webp" if thumb_format() == "webp" else ".jpg"
+            normalized_url = await store_blob(db, tmp_path, sha256, size, ext)
+            if normalized_url == avatar_url:
+                # Аватарка уже нужного размера: отдаем лишнюю ссылку обратно
+                await db.commit()
+                await release_upload(db, normalized_url)
+                return
+
+            # Меняем аватарку, только если пользователь не успел загрузить новую
+            result = await db.execute(
+                update(UserModel)
+                .where(UserModel.id == user_id, UserModel.avatar == avatar_url)
+                .values(avatar=normalized_url)
+            )
+            await db.commit()
+
+            if result.rowcount:
+                await invalidate_user(user_id)
+                await release_upload(db, avatar_url)
+            else:
+                await release_upload(db, normalized_url)
+
+
+media_processor = MediaProcessor()
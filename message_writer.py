@@ -0,0 +1,71 @@
+from typing import List, Optional, Tuple
+import asyncio
+import os
+
+from database import AsyncSessionLocal
+from models import Message as MessageModel
+
+# Максимум сообщений, сохраняемых одной транзакцией
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", "100"))
+
+
+class MessageWriter:
+    """Фоновая задача, которая сохраняет сообщения чата пачками.
+
+    Все сообщения, накопившиеся в очереди к моменту записи, вставляются
+    одной транзакцией, а отправитель получает сохраненную модель (с id)
+    через future.
+    """
+
+    def __init__(self, batch_size: int = CHAT_WRITE_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if not self._task:
+            return
+        # Дописываем то, что уже в очереди
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def submit(self, message: MessageModel) -> MessageModel:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((message, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _write(self, batch: List[Tuple[MessageModel, asyncio.Future]]):
+        try:
+            async with AsyncSessionLocal() as db:
+                db.add_all([message for message, _ in batch])
+                await db.commit()
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for message, future in batch:
+            if not future.done():
+                future.set_result(message)
+
+
+message_writer = MessageWriter()
@@ -0,0 +1,248 @@
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+import time
+
+from sqlalchemy import event
+
+from query_budget import RequestStats, current_request, finish_request, record_query
+
+# Границы корзин гистограмм
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+THROUGHPUT_BUCKETS = tuple(2 ** power * 1024 for power in range(6, 19, 2))  # 64 КБ/с ... 256 МБ/с
+# Запросы с телом меньше этого размера не считаем загрузками файлов
+UPLOAD_MIN_BYTES = 64 * 1024
+# Типы SQL-запросов для метки operation, остальное - OTHER
+SQL_OPERATIONS = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: dict) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in key) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        # метки -> [счетчики по корзинам (последняя - +Inf), сумма, количество]
+        self.values: Dict[LabelKey, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                bucket_key = key + (("le", _format_value(float(bound))),)
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_key)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class CallbackMetric:
+    """Значение, которое считывается в момент запроса /metrics (размер кэша, число соединений).
+
+    collect возвращает число или список пар (метки, число).
+    """
+
+    def __init__(self, name: str, help: str, collect: Callable, kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.collect = collect
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            result = self.collect()
+        except Exception as e:
+            print(f"Ошибка при сборе метрики {self.name}: {e}")
+            return lines
+        samples = [({}, result)] if isinstance(result, (int, float)) else result
+        for labels, value in samples:
+            lines.append(f"{self.name}{_format_labels(_label_key(labels))} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Метрики текущего процесса в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._register(Counter(name, help))
+
+    def histogram(self, name: str, help: str, buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, buckets))
+
+    def callback(self, name: str, help: str, collect: Callable, kind: str = "gauge") -> CallbackMetric:
+        return self._register(CallbackMetric(name, help, collect, kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+REQUESTS = metrics.counter("http_requests_total", "HTTP-запросы по маршруту и коду ответа")
+REQUEST_DURATION = metrics.histogram("http_request_duration_seconds", "Время обработки HTTP-запроса")
+REQUEST_QUERIES = metrics.histogram(
+    "http_request_db_queries", "SQL-запросов на один HTTP-запрос", QUERY_COUNT_BUCKETS
+)
+REQUEST_BODY_BYTES = metrics.counter("http_request_body_bytes_total", "Принято байт в телах запросов")
+UPLOAD_THROUGHPUT = metrics.histogram(
+    "http_upload_bytes_per_second", "Скорость приема тела запроса (от 64 КБ)", THROUGHPUT_BUCKETS
+)
+DB_QUERIES = metrics.counter("db_queries_total", "Выполненные SQL-запросы")
+DB_QUERY_DURATION = metrics.histogram("db_query_duration_seconds", "Время выполнения SQL-запроса")
+DB_POOL_WAIT = metrics.histogram(
+    "db_pool_checkout_seconds", "Ожидание соединения из пула (включая открытие нового)"
+)
+BROADCAST_FANOUT = metrics.histogram(
+    "broadcast_fanout_seconds", "Доставка сообщения всем подписчикам канала в этом воркере"
+)
+
+
+def sql_operation(statement: str) -> str:
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return operation if operation in SQL_OPERATIONS else "OTHER"
+
+
+def instrument_engine(sync_engine):
+    """Замер каждого SQL-запроса движка и привязка к текущему HTTP-запросу (query_budget)"""
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Запросы одного соединения идут строго по очереди - хватает одной отметки
+        conn.info["metrics_started"] = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info.pop("metrics_started")
+        operation = sql_operation(statement)
+        DB_QUERIES.inc(operation=operation)
+        DB_QUERY_DURATION.observe(elapsed, operation=operation)
+        record_query(statement, elapsed)
+
+
+def route_label(scope) -> str:
+    # Шаблон маршрута (/api/user/{user_id}), а не конкретный путь - иначе меток будет без счета
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    mount_path = scope.get("root_path", "")
+    if mount_path:
+        return mount_path + "/{path}"
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: время, код ответа, число SQL-запросов и скорость приема тела.
+
+    Заодно проверяет бюджет SQL-запросов (query_budget.finish_request).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(f"{scope['method']} {scope['path']}")
+        token = current_request.set(stats)
+        status_code = 500
+        body_bytes = 0
+        body_finished = None
+
+        async def receive_wrapper():
+            nonlocal body_bytes, body_finished
+            message = await receive()
+            if message["type"] == "http.request":
+                body_bytes += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    body_finished = time.perf_counter()
+            return message
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request.reset(token)
+
+            route = route_label(scope)
+            method = scope["method"]
+            REQUESTS.inc(method=method, route=route, status=status_code)
+            REQUEST_DURATION.observe(elapsed, method=method, route=route)
+            REQUEST_QUERIES.observe(stats.queries, route=route)
+            if body_bytes:
+                REQUEST_BODY_BYTES.inc(body_bytes, route=route)
+            if body_bytes >= UPLOAD_MIN_BYTES and body_finished is not None:
+                # Заголовки уже получены, тело начинает идти с началом обработки запроса
+                UPLOAD_THROUGHPUT.observe(body_bytes / max(body_finished - started, 1e-6), route=route)
+        # Только для завершившихся без исключения: упавший запрос и так будет в логе
+        finish_request(stats)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, timedelta
 from database import Base
@@ -17,6 +17,10 @@ class TaskStatus:
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Список подчиненных для начальника
+        Index("ix_users_role_id", "role", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(100), unique=True, nullable=False, index=True)
@@ -26,6 +30,8 @@ class User(Base):
     avatar = Column(String(500), nullable=True)
     description = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Версия строки для ETag/Last-Modified, обновляется при любом UPDATE
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
     # Связи
     created_tasks = relationship("Task", foreign_keys="Task.created_by_id", back_populates="creator")
@@ -34,6 +40,11 @@ class User(Base):
 
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        # Задачи начальника и задачи подчиненного (профиль и /api/tasks)
+        Index("ix_tasks_created_by_id_id", "created_by_id", "id"),
+        Index("ix_tasks_assigned_to_id_id", "assigned_to_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), nullable=False)
@@ -42,6 +53,7 @@ class Task(Base):
     created_by_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     assigned_to_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
     # Связи
     creator = relationship("User", foreign_keys=[created_by_id], back_populates="created_tasks")
@@ -50,6 +62,11 @@ class Task(Base):
 
 class UserSession(Base):
     __tablename__ = "sessions"
+    __table_args__ = (
+        # Сессии пользователя и удаление просроченных
+        Index("ix_sessions_user_id_expires_at", "user_id", "expires_at"),
+        Index("ix_sessions_expires_at", "expires_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String(255), unique=True, nullable=False, index=True)
@@ -60,14 +77,32 @@ class UserSession(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # Сообщения автора и выборки по дате
+        Index("ix_messages_user_id_id", "user_id", "id"),
+        Index("ix_messages_created_at", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     content = Column(Text, nullable=True)  # Текст сообщения (может быть None для медиа)
     message_type = Column(String(20), nullable=False, default="text")  # text, image, video, audio
     file_path = Column(String(500), nullable=True)  # Путь к файлу для медиа
+    thumbnail_path = Column(String(500), nullable=True)  # Миниатюра картинки или кадр-превью видео
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
     # Связи
     user = relationship("User", backref="messages")
 
+
+
+class MediaBlob(Base):
+    __tablename__ = "media_blobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    path = Column(String(500), unique=True, nullable=False, index=True)  # URL файла: /uploads/media/ab/<sha256>.ext
+    sha256 = Column(String(64), nullable=False)
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)  # Сколько аватарок и сообщений ссылаются на файл
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -0,0 +1,67 @@
+from typing import Callable, Dict, Tuple
+import os
+import time
+
+from fastapi import Request
+from fastapi.responses import HTMLResponse, Response
+
+from conditional import bytes_etag, is_not_modified
+
+# Сколько секунд отдавать готовый HTML анонимных страниц без повторного рендера (0 - выключено)
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", "300"))
+# Одна и та же страница отдается и анонимам, и вошедшим - прокси не должны хранить ее общей
+PAGE_CACHE_HEADERS = {"Cache-Control": "private, no-cache", "Vary": "Cookie"}
+
+
+class PageCache:
+    """Готовый HTML страниц для анонимных посетителей (главная, игры, вход, регистрация).
+
+    Для всех анонимов страница одинаковая, поэтому рендерим шаблон раз в ttl секунд
+    и отдаем байты из памяти с ETag. Ключ - шаблон; страницы вошедших пользователей
+    сюда не попадают.
+    """
+
+    def __init__(self, ttl: int = PAGE_CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._pages: Dict[str, Tuple[float, bytes, str]] = {}  # ключ -> (истекает, тело, ETag)
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def get_or_render(self, key: str, render: Callable[[], str]) -> Tuple[bytes, str]:
+        now = time.monotonic()
+        page = self._pages.get(key)
+        if page is not None and page[0] > now:
+            self.hits += 1
+            return page[1], page[2]
+
+        self.misses += 1
+        body = render().encode()
+        etag = bytes_etag(body)
+        if self.enabled:
+            self._pages[key] = (now + self.ttl, body, etag)
+        return body, etag
+
+    def response(self, request: Request, key: str, render: Callable[[], str]) -> Response:
+        body, etag = self.get_or_render(key, render)
+        headers = {"ETag": etag, **PAGE_CACHE_HEADERS}
+        if is_not_modified(request, etag, None):
+            return Response(status_code=304, headers=headers)
+        return HTMLResponse(body, headers=headers)
+
+    def clear(self):
+        self._pages.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._pages),
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+page_cache = PageCache()
@@ -0,0 +1,114 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import re
+import secrets
+
+# Алгоритм для новых паролей: scrypt (требует много памяти) или pbkdf2_sha256
+PASSWORD_HASH_ALGORITHM = os.getenv("PASSWORD_HASH_ALGORITHM", "scrypt")
+# Параметры scrypt: память на один хэш = 128 * n * r байт (по умолчанию 16 МБ)
+SCRYPT_N = int(os.getenv("SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.getenv("SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("SCRYPT_P", "1"))
+PBKDF2_ITERATIONS = int(os.getenv("PBKDF2_ITERATIONS", "600000"))
+# Сколько хэшей считаем одновременно. hashlib отпускает GIL, поэтому хватает потоков
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+# Старый формат: sha256 без соли в hex
+LEGACY_SHA256 = re.compile(r"[0-9a-f]{64}")
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode().rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.b64decode(data + "=" * (-len(data) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # Запас по памяти, чтобы OpenSSL не отказал при больших n и r
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r * p + 1024 * 1024, dklen=KEY_BYTES)
+
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations, dklen=KEY_BYTES)
+
+
+def hash_password_sync(password: str, algorithm: Optional[str] = None) -> str:
+    """Хэш в формате алгоритм$параметры$соль$ключ (соль и ключ в base64)"""
+    algorithm = algorithm or PASSWORD_HASH_ALGORITHM
+    salt = secrets.token_bytes(SALT_BYTES)
+    if algorithm == "scrypt":
+        key = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64encode(salt)}${_b64encode(key)}"
+    if algorithm == "pbkdf2_sha256":
+        key = _pbkdf2(password, salt, PBKDF2_ITERATIONS)
+        return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64encode(salt)}${_b64encode(key)}"
+    raise ValueError(f"Неизвестный алгоритм хэширования паролей: {algorithm}")
+
+
+def verify_password_sync(password: str, hashed: str) -> bool:
+    try:
+        if LEGACY_SHA256.fullmatch(hashed):
+            key, expected = hashlib.sha256(password.encode()).hexdigest().encode(), hashed.encode()
+        elif hashed.startswith("scrypt$"):
+            _, n, r, p, salt, expected = hashed.split("$")
+            key, expected = _scrypt(password, _b64decode(salt), int(n), int(r), int(p)), _b64decode(expected)
+        elif hashed.startswith("pbkdf2_sha256$"):
+            _, iterations, salt, expected = hashed.split("$")
+            key, expected = _pbkdf2(password, _b64decode(salt), int(iterations)), _b64decode(expected)
+        else:
+            return False
+    except ValueError:
+        # Поврежденный хэш в БД - считаем пароль неверным
+        return False
+    return hmac.compare_digest(key, expected)
+
+
+def needs_rehash(hashed: str) -> bool:
+    """Хэш старого формата или с параметрами слабее текущих - пересчитываем при входе"""
+    if PASSWORD_HASH_ALGORITHM == "scrypt":
+        return not hashed.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+    return not hashed.startswith(f"pbkdf2_sha256${PBKDF2_ITERATIONS}$")
+
+
+class PasswordHasher:
+    """Хэширование и проверка паролей в отдельном пуле потоков.
+
+    Один хэш занимает десятки миллисекунд процессора, поэтому в цикле
+    событий его считать нельзя: при наплыве входов встали бы все запросы.
+    Пул ограничен PASSWORD_HASH_WORKERS потоками - остальные входы ждут
+    в очереди, не занимая больше процессора и памяти (scrypt).
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS):
+        self.workers = max(1, workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def _run_in_pool(self, func, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def hash(self, password: str) -> str:
+        return await self._run_in_pool(hash_password_sync, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run_in_pool(verify_password_sync, password, hashed)
+
+    def stop(self):
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
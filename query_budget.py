@@ -0,0 +1,109 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+import os
+
+# Бюджет одного HTTP-запроса: больше запросов к БД или больше суммарного времени - пишем в лог (0 - не проверять)
+QUERY_BUDGET_COUNT = int(os.getenv("QUERY_BUDGET_COUNT", "20"))
+QUERY_BUDGET_MS = int(os.getenv("QUERY_BUDGET_MS", "500"))
+# Отдельный SQL-запрос дольше этого попадает в лог сразу (0 - выключено)
+SLOW_QUERY_MS = int(os.getenv("SLOW_QUERY_MS", "200"))
+# В тестах: превышение бюджета - ошибка, а не строчка в логе
+QUERY_BUDGET_RAISE = os.getenv("QUERY_BUDGET_RAISE", "false").lower() in ("1", "true", "yes", "on")
+# Сколько запросов запоминать для лога, текст каждого обрезается
+QUERY_LOG_STATEMENTS = 50
+QUERY_LOG_STATEMENT_LENGTH = 300
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def short_statement(statement: str) -> str:
+    statement = " ".join(statement.split())
+    if len(statement) > QUERY_LOG_STATEMENT_LENGTH:
+        return statement[:QUERY_LOG_STATEMENT_LENGTH] + "..."
+    return statement
+
+
+class RequestStats:
+    """SQL-запросы текущего HTTP-запроса (или блока assert_max_queries)"""
+
+    __slots__ = ("path", "queries", "query_seconds", "statements")
+
+    def __init__(self, path: str = ""):
+        self.path = path
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.statements: List[Tuple[str, float]] = []
+
+    def record(self, statement: str, seconds: float):
+        self.queries += 1
+        self.query_seconds += seconds
+        if len(self.statements) < QUERY_LOG_STATEMENTS:
+            self.statements.append((statement, seconds))
+
+    def report(self) -> str:
+        lines = [
+            f"{self.path or '(вне запроса)'}: {self.queries} SQL-запросов, {self.query_seconds * 1000:.1f} мс"
+        ]
+        for statement, seconds in self.statements:
+            lines.append(f"  {seconds * 1000:8.2f} мс  {short_statement(statement)}")
+        if self.queries > len(self.statements):
+            lines.append(f"  ... и еще {self.queries - len(self.statements)}")
+        return "\n".join(lines)
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+# Открытые блоки assert_max_queries: им же отдаются итоги запросов из других потоков (TestClient)
+_recorders: List[List[RequestStats]] = []
+
+
+def record_query(statement: str, seconds: float):
+    stats = current_request.get()
+    if stats is not None:
+        stats.record(statement, seconds)
+    if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+        path = stats.path if stats is not None else "(вне запроса)"
+        print(f"Медленный SQL-запрос ({seconds * 1000:.1f} мс, {path}): {short_statement(statement)}")
+
+
+def over_budget(stats: RequestStats) -> bool:
+    return (
+        (QUERY_BUDGET_COUNT and stats.queries > QUERY_BUDGET_COUNT)
+        or (QUERY_BUDGET_MS and stats.query_seconds * 1000 > QUERY_BUDGET_MS)
+    )
+
+
+def finish_request(stats: RequestStats):
+    """Вызывается после каждого HTTP-запроса: проверка бюджета и передача итогов в assert_max_queries"""
+    for recorded in _recorders:
+        recorded.append(stats)
+    if not over_budget(stats):
+        return
+    report = stats.report()
+    if QUERY_BUDGET_RAISE:
+        raise QueryBudgetExceeded(f"Превышен бюджет SQL-запросов\n{report}")
+    print(f"Превышен бюджет SQL-запросов: {report}")
+
+
+@contextmanager
+def assert_max_queries(limit: int):
+    """Для тестов: каждый HTTP-запрос внутри блока (и код самого блока) делает не больше limit запросов к БД.
+
+        with assert_max_queries(3):
+            client.post("/api/chat/message", data={"content": "привет"})
+    """
+    recorded: List[RequestStats] = []
+    own = RequestStats("(блок assert_max_queries)")
+    token = current_request.set(own)
+    _recorders.append(recorded)
+    try:
+        yield recorded
+    finally:
+        _recorders.remove(recorded)
+        current_request.reset(token)
+
+    for stats in [own, *recorded]:
+        if stats.queries > limit:
+            raise QueryBudgetExceeded(f"Ожидалось не больше {limit} SQL-запросов\n{stats.report()}")
@@ -0,0 +1,96 @@
+from datetime import datetime
+from typing import Optional
+import asyncio
+import os
+
+from sqlalchemy import delete, select
+
+from database import AsyncSessionLocal
+from models import UserSession as SessionModel
+
+# Как часто удаляем просроченные сессии (секунды) и сколько строк за одну транзакцию
+SESSION_REAP_INTERVAL = int(os.getenv("SESSION_REAP_INTERVAL", "600"))
+SESSION_REAP_BATCH_SIZE = int(os.getenv("SESSION_REAP_BATCH_SIZE", "1000"))
+# Максимум одновременных сессий одного пользователя (0 - без ограничения)
+SESSION_MAX_PER_USER = int(os.getenv("SESSION_MAX_PER_USER", "10"))
+
+
+# Удаление одной пачки просроченных сессий
+def reap_statement(now: datetime, batch_size: int):
+    expired = (
+        select(SessionModel.id)
+        .where(SessionModel.expires_at <= now)
+        .limit(batch_size)
+        .scalar_subquery()
+    )
+    return delete(SessionModel).where(SessionModel.id.in_(expired))
+
+
+# Сессии пользователя сверх лимита: самые давно продленные (и уже просроченные) идут первыми на удаление
+def excess_sessions_statement(user_id: int, keep: int):
+    return (
+        select(SessionModel.id, SessionModel.session_id)
+        .where(SessionModel.user_id == user_id)
+        .order_by(SessionModel.expires_at.desc(), SessionModel.id.desc())
+        .offset(keep)
+    )
+
+
+class SessionReaper:
+    """Фоновая задача, которая удаляет просроченные сессии.
+
+    Удаляем небольшими пачками, каждая в своей транзакции, чтобы не держать
+    блокировку записи (в SQLite - на всю базу) во время входа пользователей.
+    """
+
+    def __init__(self, interval: int = SESSION_REAP_INTERVAL, batch_size: int = SESSION_REAP_BATCH_SIZE):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.reaped = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0 and self.batch_size > 0
+
+    async def start(self):
+        if self.enabled:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def reap(self) -> int:
+        now = datetime.utcnow()
+        total = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(reap_statement(now, self.batch_size))
+                await db.commit()
+            total += result.rowcount
+            if result.rowcount < self.batch_size:
+                break
+            # Даем другим запросам записать между пачками
+            await asyncio.sleep(0)
+        self.reaped += total
+        return total
+
+    async def _run(self):
+        while True:
+            try:
+                removed = await self.reap()
+                if removed:
+                    print(f"Удалено просроченных сессий: {removed}")
+            except Exception as e:
+                print(f"Ошибка при удалении просроченных сессий: {e}")
+            await asyncio.sleep(self.interval)
+
+
+session_reaper = SessionReaper()
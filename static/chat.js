@@ -4,6 +4,14 @@ let selectedFiles = [];
 let mediaRecorder = null;
 let audioChunks = [];
 let isRecording = false;
+let messageCounter = 0;
+// Границы загруженной истории для постраничной подгрузки
+const MESSAGES_PAGE_SIZE = 50;
+let oldestMessageId = null;
+let newestMessageId = null;
+let hasMoreHistory = true;
+let loadingHistory = false;
+let wsConnectedBefore = false;
 
 // Инициализация чата
 document.addEventListener('DOMContentLoaded', () => {
@@ -28,6 +36,11 @@ function connectWebSocket() {
     
     ws.onopen = () => {
         console.log('WebSocket подключен');
+        // После переподключения догружаем только пропущенные сообщения
+        if (wsConnectedBefore) {
+            catchUpMessages();
+        }
+        wsConnectedBefore = true;
         // Отправляем ping для поддержания соединения каждые 30 секунд
         setInterval(() => {
             if (ws && ws.readyState === WebSocket.OPEN) {
@@ -45,6 +58,22 @@ function connectWebSocket() {
                 return;
             }
             
+            // Подтверждение сохранения нашего сообщения - само сообщение придет отдельной рассылкой
+            if (data.type === 'ack') {
+                return;
+            }
+            
+            // Для медиа-сообщения готова миниатюра
+            if (data.type === 'message_update') {
+                applyThumbnail(data.id, data.thumbnail_path);
+                return;
+            }
+            
+            if (data.type === 'error') {
+                showNotification(data.detail || 'Ошибка отправки сообщения', 'error');
+                return;
+            }
+            
             // Отображаем сообщения чата
             // (проверка на дубликаты уже есть в displayMessage)
             displayMessage(data);
@@ -63,20 +92,27 @@ function connectWebSocket() {
     };
 }
 
+// Запрос страницы сообщений (before_id / after_id)
+async function fetchMessages(params) {
+    const query = new URLSearchParams({ limit: MESSAGES_PAGE_SIZE, ...params });
+    const response = await fetch(`${API_URL}/api/chat/messages?${query}`, {
+        credentials: 'include'
+    });
+    
+    if (!response.ok) {
+        throw new Error('Ошибка загрузки сообщений');
+    }
+    
+    return response.json();
+}
+
 // Загрузка сообщений
 async function loadMessages() {
     try {
-        const response = await fetch(`${API_URL}/api/chat/messages`, {
-            credentials: 'include'
-        });
-        
-        if (!response.ok) {
-            throw new Error('Ошибка загрузки сообщений');
-        }
-        
-        const messages = await response.json();
+        const messages = await fetchMessages({});
         const container = document.getElementById('messages-container');
         container.innerHTML = '';
+        hasMoreHistory = messages.length === MESSAGES_PAGE_SIZE;
         
         if (messages.length === 0) {
             container.innerHTML = '<div class="empty-state"><p>Пока нет сообщений</p></div>';
@@ -91,11 +127,53 @@ async function loadMessages() {
     }
 }
 
-// Отображение сообщения
-function displayMessage(msg) {
+// Подгрузка более старых сообщений при прокрутке вверх
+async function loadOlderMessages() {
+    if (loadingHistory || !hasMoreHistory || oldestMessageId === null) {
+        return;
+    }
+    
+    loadingHistory = true;
+    try {
+        const container = document.getElementById('messages-container');
+        const messages = await fetchMessages({ before_id: oldestMessageId });
+        hasMoreHistory = messages.length === MESSAGES_PAGE_SIZE;
+        
+        // Сохраняем позицию прокрутки, чтобы содержимое не прыгало
+        const previousHeight = container.scrollHeight;
+        messages.slice().reverse().forEach(msg => displayMessage(msg, true));
+        container.scrollTop += container.scrollHeight - previousHeight;
+    } catch (error) {
+        console.error('Ошибка загрузки истории:', error);
+    } finally {
+        loadingHistory = false;
+    }
+}
+
+// Догрузка сообщений, пришедших пока WebSocket был отключен
+async function catchUpMessages() {
+    if (newestMessageId === null) {
+        return loadMessages();
+    }
+    
+    try {
+        let messages;
+        do {
+            messages = await fetchMessages({ after_id: newestMessageId });
+            messages.forEach(msg => displayMessage(msg));
+        } while (messages.length === MESSAGES_PAGE_SIZE);
+    } catch (error) {
+        console.error('Ошибка догрузки сообщений:', error);
+    }
+}
+
+// Отображение сообщения (prepend - для более старых сообщений из истории)
+function displayMessage(msg, prepend = false) {
     const container = document.getElementById('messages-container');
     const loading = document.getElementById('messages-loading');
     if (loading) loading.remove();
+    const emptyState = container.querySelector('.empty-state');
+    if (emptyState) emptyState.remove();
     
     // Проверяем, не отображается ли уже это сообщение
     const existingMessage = container.querySelector(`[data-message-id="${msg.id}"]`);
@@ -113,9 +191,11 @@ function displayMessage(msg) {
     
     let mediaContent = '';
     if (msg.message_type === 'image' && msg.file_path) {
-        mediaContent = `<img src="${msg.file_path}" alt="Изображение" class="message-media">`;
+        // Сначала грузим миниатюру, оригинал открывается по клику
+        mediaContent = `<a href="${msg.file_path}" target="_blank"><img src="${msg.thumbnail_path || msg.file_path}" alt="Изображение" class="message-media" loading="lazy"></a>`;
     } else if (msg.message_type === 'video' && msg.file_path) {
-        mediaContent = `<video src="${msg.file_path}" controls class="message-media"></video>`;
+        const poster = msg.thumbnail_path ? `poster="${msg.thumbnail_path}" preload="none"` : 'preload="metadata"';
+        mediaContent = `<video src="${msg.file_path}" ${poster} controls class="message-media"></video>`;
     } else if (msg.message_type === 'audio' && msg.file_path) {
         mediaContent = `<audio src="${msg.file_path}" controls class="message-audio"></audio>`;
     }
@@ -142,6 +222,14 @@ function displayMessage(msg) {
         </div>
     `;
     
+    if (oldestMessageId === null || msg.id < oldestMessageId) oldestMessageId = msg.id;
+    if (newestMessageId === null || msg.id > newestMessageId) newestMessageId = msg.id;
+    
+    if (prepend) {
+        container.insertBefore(messageDiv, container.firstChild);
+        return;
+    }
+    
     container.appendChild(messageDiv);
     
     // Прокручиваем вниз только если пользователь уже внизу (чтобы не мешать чтению старых сообщений)
@@ -151,6 +239,18 @@ function displayMessage(msg) {
     }
 }
 
+// Подмена медиа на миниатюру, когда сервер ее подготовил
+function applyThumbnail(messageId, thumbnailPath) {
+    const messageDiv = document.querySelector(`[data-message-id="${messageId}"]`);
+    if (!messageDiv || !thumbnailPath) return;
+    
+    const img = messageDiv.querySelector('img.message-media');
+    if (img) img.src = thumbnailPath;
+    
+    const video = messageDiv.querySelector('video.message-media');
+    if (video) video.poster = thumbnailPath;
+}
+
 // Отправка сообщения
 async function sendMessage(event) {
     event.preventDefault();
@@ -162,6 +262,18 @@ async function sendMessage(event) {
         return;
     }
     
+    // Текст без файлов отправляем прямо через WebSocket
+    if (audioChunks.length === 0 && selectedFiles.length === 0 && ws && ws.readyState === WebSocket.OPEN) {
+        messageCounter += 1;
+        ws.send(JSON.stringify({
+            type: 'message',
+            content: content,
+            client_id: `${currentUser.id}-${Date.now()}-${messageCounter}`
+        }));
+        input.value = '';
+        return;
+    }
+    
     const formData = new FormData();
     if (content) {
         formData.append('content', content);
@@ -215,6 +327,13 @@ function handleKeyPress(event) {
 
 // Настройка обработчиков событий
 function setupEventListeners() {
+    // История подгружается при прокрутке к началу
+    document.getElementById('messages-container').addEventListener('scroll', (e) => {
+        if (e.target.scrollTop < 50) {
+            loadOlderMessages();
+        }
+    });
+    
     // Прикрепление файлов
     document.getElementById('attach-btn').addEventListener('click', () => {
         document.getElementById('file-input').click();
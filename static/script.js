@@ -336,9 +336,12 @@ async function handleTaskCreate(event) {
         const result = await response.json();
         showNotification('Задача создана!', 'success');
         hideTaskForm();
-        setTimeout(() => {
-            window.location.reload();
-        }, 1000);
+        // Карточка придет событием tasks_created; без WebSocket перезагружаем страницу
+        if (!tasksSocketOpen()) {
+            setTimeout(() => {
+                window.location.reload();
+            }, 1000);
+        }
     } catch (error) {
         showNotification(error.message, 'error');
     }
@@ -363,89 +366,245 @@ async function updateTaskStatus(taskId, status) {
         
         const result = await response.json();
         showNotification('Статус задачи обновлен!', 'success');
+        // Счетчики пересчитаются по событию tasks_updated
+        if (!tasksSocketOpen()) {
+            refreshTaskCounts();
+        }
         
         // Обновляем бейдж статуса
         const taskCard = document.querySelector(`[data-task-id="${taskId}"]`);
         if (taskCard) {
-            const badge = taskCard.querySelector('.badge-status');
-            if (badge) {
-                badge.className = `badge badge-status badge-${status}`;
-                const statusText = {
-                    'pending': 'В ожидании',
-                    'in_progress': 'В работе',
-                    'completed': 'Выполнено'
-                };
-                badge.textContent = statusText[status] || status;
-            }
+            setTaskCardStatus(taskCard, status);
         }
     } catch (error) {
         showNotification(error.message, 'error');
     }
 }
 
-// Загрузка имен пользователей для задач
-async function loadTaskUserNames() {
+// Бейдж и выпадающий список статуса в карточке задачи
+function setTaskCardStatus(taskCard, status) {
+    const badge = taskCard.querySelector('.badge-status');
+    if (badge) {
+        badge.className = `badge badge-status badge-${status}`;
+        const statusText = {
+            'pending': 'В ожидании',
+            'in_progress': 'В работе',
+            'completed': 'Выполнено'
+        };
+        badge.textContent = statusText[status] || status;
+    }
+    const select = taskCard.querySelector('.status-select');
+    if (select) {
+        select.value = status;
+    }
+}
+
+// Задачи - постраничная загрузка и фильтр по статусу
+const TASKS_PAGE_SIZE = 20;
+let taskStatusFilter = '';
+let tasksLoading = false;
+let tasksRequestId = 0;
+
+// Время приходит в UTC без пояса - выводим как в шаблоне, без перевода
+function formatTaskDate(value) {
+    const [date, time] = value.split('T');
+    const [year, month, day] = date.split('-');
+    return `${day}.${month}.${year} ${time.slice(0, 5)}`;
+}
+
+// Карточка задачи - та же разметка, что и в profile.html
+function renderTaskCard(task) {
+    const card = document.createElement('div');
+    card.className = 'task-card';
+    card.dataset.taskId = task.id;
+    
+    const counterpart = userRole === 'boss'
+        ? `<p>Назначено: <strong id="assigned-name-${task.id}">${escapeHtml(task.assignee ? task.assignee.username : 'Неизвестно')}</strong></p>`
+        : `<p>От: <strong id="creator-name-${task.id}">${escapeHtml(task.creator ? task.creator.username : 'Начальник')}</strong></p>`;
+    
+    let actions = '';
+    if (userRole === 'employee') {
+        const options = [['pending', 'В ожидании'], ['in_progress', 'В работе'], ['completed', 'Выполнено']]
+            .map(([value, label]) => `<option value="${value}" ${task.status === value ? 'selected' : ''}>${label}</option>`)
+            .join('');
+        actions = `
+            <div class="task-actions">
+                <select class="status-select" onchange="updateTaskStatus(${task.id}, this.value)">${options}</select>
+            </div>`;
+    }
+    
+    card.innerHTML = `
+        <div class="task-header">
+            <h3>${escapeHtml(task.title)}</h3>
+            <span class="badge badge-status badge-${task.status}">${escapeHtml(task.status)}</span>
+        </div>
+        <p class="task-description">${escapeHtml(task.description)}</p>
+        <div class="task-meta">
+            ${counterpart}
+            <p>Создано: ${formatTaskDate(task.created_at)}</p>
+        </div>
+        ${actions}`;
+    return card;
+}
+
+// Следующая страница задач (или первая - при смене фильтра)
+async function loadMoreTasks(reset = false) {
+    if (tasksLoading && !reset) return;
+    const requestId = ++tasksRequestId;
+    tasksLoading = true;
+    
+    const list = document.getElementById('tasks-list');
+    const moreButton = document.getElementById('tasks-more');
+    
     try {
-        const taskCards = document.querySelectorAll('.task-card');
+        const params = new URLSearchParams({ limit: TASKS_PAGE_SIZE });
+        if (taskStatusFilter) {
+            params.set('status', taskStatusFilter);
+        }
+        const cards = list.querySelectorAll('.task-card');
+        if (!reset && cards.length) {
+            params.set('before_id', cards[cards.length - 1].dataset.taskId);
+        }
         
-        for (const card of taskCards) {
-            const taskId = card.dataset.taskId;
-            const assignedNameEl = card.querySelector(`#assigned-name-${taskId}`);
-            const creatorNameEl = card.querySelector(`#creator-name-${taskId}`);
-            
-            if (assignedNameEl || creatorNameEl) {
-                // Получаем задачи из API
-                const response = await fetch(`${API_URL}/api/tasks`, {
-                    credentials: 'include'
-                });
-                
-                if (response.ok) {
-                    const tasks = await response.json();
-                    const task = tasks.find(t => t.id === parseInt(taskId));
-                    
-                    if (task) {
-                        // Для начальника - имя назначенного
-                        if (assignedNameEl && typeof userRole !== 'undefined' && userRole === 'boss') {
-                            try {
-                                const userResponse = await fetch(`${API_URL}/api/user/${task.assigned_to_id}`, {
-                                    credentials: 'include'
-                                });
-                                if (userResponse.ok) {
-                                    const user = await userResponse.json();
-                                    assignedNameEl.textContent = user.username;
-                                } else {
-                                    assignedNameEl.textContent = 'Неизвестно';
-                                }
-                            } catch (error) {
-                                assignedNameEl.textContent = 'Неизвестно';
-                            }
-                        }
-                        
-                        // Для подчиненного - имя создателя
-                        if (creatorNameEl && typeof userRole !== 'undefined' && userRole === 'employee') {
-                            try {
-                                const userResponse = await fetch(`${API_URL}/api/user/${task.created_by_id}`, {
-                                    credentials: 'include'
-                                });
-                                if (userResponse.ok) {
-                                    const user = await userResponse.json();
-                                    creatorNameEl.textContent = user.username;
-                                } else {
-                                    creatorNameEl.textContent = 'Начальник';
-                                }
-                            } catch (error) {
-                                creatorNameEl.textContent = 'Начальник';
-                            }
-                        }
-                    }
-                }
-            }
+        const response = await fetch(`${API_URL}/api/tasks?${params}`, {
+            credentials: 'include'
+        });
+        if (!response.ok) {
+            throw new Error('Ошибка загрузки задач');
+        }
+        const tasks = await response.json();
+        
+        // Пока шел запрос, фильтр успели сменить
+        if (requestId !== tasksRequestId) return;
+        
+        if (reset) {
+            list.innerHTML = '';
+        }
+        tasks.forEach(task => list.appendChild(renderTaskCard(task)));
+        if (!list.querySelector('.task-card')) {
+            list.innerHTML = '<div class="empty-state"><p>Нет задач</p></div>';
+        }
+        moreButton.style.display = tasks.length === TASKS_PAGE_SIZE ? '' : 'none';
+    } catch (error) {
+        showNotification(error.message, 'error');
+    } finally {
+        if (requestId === tasksRequestId) {
+            tasksLoading = false;
         }
+    }
+}
+
+function setTaskFilter(status) {
+    taskStatusFilter = status;
+    document.querySelectorAll('.task-filter').forEach(button => {
+        button.classList.toggle('active', button.dataset.status === status);
+    });
+    loadMoreTasks(true);
+}
+
+// Счетчики по статусам после изменения задач
+async function refreshTaskCounts() {
+    try {
+        const response = await fetch(`${API_URL}/api/tasks/counts`, {
+            credentials: 'include'
+        });
+        if (!response.ok) return;
+        const counts = await response.json();
+        document.querySelectorAll('.task-filter').forEach(button => {
+            const count = counts[button.dataset.status || 'total'];
+            button.querySelector('span').textContent = count ?? 0;
+        });
     } catch (error) {
-        console.error('Ошибка загрузки имен:', error);
+        console.error('Ошибка загрузки счетчиков задач:', error);
     }
 }
 
+// Задачи - события в реальном времени через /ws/tasks
+let tasksSocket = null;
+let tasksSocketConnectedBefore = false;
+let tasksPingTimer = null;
+
+function tasksSocketOpen() {
+    return tasksSocket !== null && tasksSocket.readyState === WebSocket.OPEN;
+}
+
+function connectTasksSocket() {
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    tasksSocket = new WebSocket(`${protocol}//${window.location.host}/ws/tasks`);
+    
+    tasksSocket.onopen = () => {
+        // Пока соединения не было, события могли потеряться - перечитываем список и счетчики
+        if (tasksSocketConnectedBefore) {
+            loadMoreTasks(true);
+            refreshTaskCounts();
+        }
+        tasksSocketConnectedBefore = true;
+        clearInterval(tasksPingTimer);
+        tasksPingTimer = setInterval(() => {
+            if (tasksSocketOpen()) {
+                tasksSocket.send(JSON.stringify({ type: 'ping' }));
+            }
+        }, 30000);
+    };
+    
+    tasksSocket.onmessage = (event) => {
+        try {
+            const data = JSON.parse(event.data);
+            if (data.type === 'tasks_created') {
+                applyCreatedTasks(data.tasks);
+            } else if (data.type === 'tasks_updated') {
+                applyUpdatedTasks(data.tasks);
+            }
+        } catch (error) {
+            console.error('Ошибка обработки события задач:', error);
+        }
+    };
+    
+    tasksSocket.onclose = () => {
+        clearInterval(tasksPingTimer);
+        setTimeout(connectTasksSocket, 3000);
+    };
+}
+
+function adjustTaskCount(status, delta) {
+    for (const key of [status, '']) {
+        const counter = document.querySelector(`.task-filter[data-status="${key}"] span`);
+        if (counter) {
+            counter.textContent = (parseInt(counter.textContent, 10) || 0) + delta;
+        }
+    }
+}
+
+// Новые задачи - в начало списка (список отсортирован от новых к старым)
+function applyCreatedTasks(tasks) {
+    const list = document.getElementById('tasks-list');
+    tasks.forEach(task => {
+        if (list.querySelector(`.task-card[data-task-id="${task.id}"]`)) return;
+        adjustTaskCount(task.status, 1);
+        if (taskStatusFilter && task.status !== taskStatusFilter) return;
+        const emptyState = list.querySelector('.empty-state');
+        if (emptyState) {
+            emptyState.remove();
+        }
+        list.prepend(renderTaskCard(task));
+    });
+}
+
+// Изменения статуса: {id, status, previous_status}
+function applyUpdatedTasks(changes) {
+    changes.forEach(change => {
+        adjustTaskCount(change.previous_status, -1);
+        adjustTaskCount(change.status, 1);
+        const card = document.querySelector(`.task-card[data-task-id="${change.id}"]`);
+        if (!card) return;
+        if (taskStatusFilter && change.status !== taskStatusFilter) {
+            card.remove();
+            return;
+        }
+        setTaskCardStatus(card, change.status);
+    });
+}
+
 // Инициализация на странице профиля
 if (document.querySelector('.profile-main')) {
     if (typeof userRole !== 'undefined' && userRole === 'boss') {
@@ -461,6 +620,17 @@ if (document.querySelector('.profile-main')) {
         }
     }
     
-    // Загружаем имена пользователей для задач
-    loadTaskUserNames();
+    // Новые задачи и смена статусов приходят без перезагрузки страницы
+    connectTasksSocket();
+    
+    // Догружаем задачи, когда кнопка "Показать еще" появляется на экране
+    const moreButton = document.getElementById('tasks-more');
+    if (moreButton && 'IntersectionObserver' in window) {
+        const moreObserver = new IntersectionObserver((entries) => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadMoreTasks();
+            }
+        }, { rootMargin: '200px' });
+        moreObserver.observe(moreButton);
+    }
 }
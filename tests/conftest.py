@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# До импорта приложения: отдельная БД для тестов и быстрый scrypt
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/test.db")
+os.environ.setdefault("SCRYPT_N", "1024")
@@ -0,0 +1,55 @@
+"""Число SQL-запросов основных эндпоинтов: лишние refresh() и повторные выборки не должны вернуться"""
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from query_budget import assert_max_queries
+
+
+@pytest.fixture(scope="module")
+def clients():
+    with TestClient(main.app) as boss:
+        response = boss.post("/api/login", json={"email": "boss@valve.com", "password": "admin123"})
+        assert response.status_code == 200, response.text
+
+        # Второй клиент без with: startup уже выполнен первым
+        employee = TestClient(main.app)
+        response = employee.post("/api/register", json={
+            "username": "employee", "email": "employee@valve.com", "password": "secret", "role": "employee"
+        })
+        assert response.status_code == 200, response.text
+        employee_id = response.json()["user"]["id"]
+
+        # Сессии попадают в кэш - дальше авторизация без запросов к БД
+        boss.get("/api/user")
+        employee.get("/api/user")
+        yield boss, employee, employee_id
+
+
+def test_send_message(clients):
+    boss, _, _ = clients
+    with assert_max_queries(1):
+        response = boss.post("/api/chat/message", data={"content": "привет"})
+    assert response.status_code == 200, response.text
+
+
+def test_create_and_update_task(clients):
+    boss, employee, employee_id = clients
+    with assert_max_queries(2):
+        response = boss.post("/api/tasks", json={
+            "title": "Отчет", "description": "К пятнице", "assigned_to_id": employee_id
+        })
+    assert response.status_code == 200, response.text
+    task_id = response.json()["id"]
+
+    with assert_max_queries(2):
+        response = employee.patch(f"/api/tasks/{task_id}", json={"status": "in_progress"})
+    assert response.status_code == 200, response.text
+    assert response.json()["status"] == "in_progress"
+
+
+def test_update_user(clients):
+    boss, _, _ = clients
+    with assert_max_queries(1):
+        response = boss.patch("/api/user", json={"description": "Начальник"})
+    assert response.status_code == 200, response.text
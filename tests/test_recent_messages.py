@@ -0,0 +1,70 @@
+import json
+
+from cache import RecentMessages
+
+
+def message(message_id: int) -> dict:
+    return {"id": message_id, "content": f"сообщение {message_id}"}
+
+
+def warm_buffer(*ids: int) -> RecentMessages:
+    buffer = RecentMessages(maxlen=100, max_bytes=2 ** 20)
+    generation = buffer.start_warming()
+    buffer.fill([message(message_id) for message_id in ids], complete=True, generation=generation)
+    return buffer
+
+
+def page_ids(page: bytes) -> list:
+    return [item["id"] for item in json.loads(page)]
+
+
+def test_out_of_order_publish_falls_back_to_db():
+    buffer = warm_buffer(1, 2, 3)
+    # 5 разослали раньше, чем 4
+    buffer.add(message(5))
+
+    assert buffer.get(None, 3, 50) is None
+    assert buffer.get(None, None, 50) is None
+
+    buffer.add(message(4))
+    assert page_ids(buffer.get(None, 3, 50)) == [4, 5]
+    assert page_ids(buffer.get(None, None, 50)) == [1, 2, 3, 4, 5]
+
+
+def test_after_id_right_before_gap_is_not_served():
+    buffer = warm_buffer(1, 2, 3)
+    buffer.add(message(6))
+    buffer.add(message(5))
+
+    assert buffer.get(None, 3, 50) is None
+    # Выше пропуска id идут подряд
+    assert page_ids(buffer.get(None, 4, 50)) == [5, 6]
+
+
+def test_before_id_page_with_gap_is_not_served():
+    buffer = warm_buffer(1, 2, 4, 5)
+
+    assert buffer.get(5, None, 2) is None
+    assert page_ids(buffer.get(6, None, 2)) == [4, 5]
+    assert page_ids(buffer.get(3, None, 50)) == [1, 2]
+
+
+def test_empty_page_after_newest_message():
+    buffer = warm_buffer(1, 2, 3)
+
+    assert buffer.get(None, 3, 50) == b"[]"
+
+
+def test_failed_warming_can_be_retried():
+    buffer = RecentMessages(maxlen=10, max_bytes=2 ** 20)
+    generation = buffer.start_warming()
+    for message_id in range(1, 1001):
+        buffer.add(message(message_id))
+    assert len(buffer._pending) == 10
+
+    buffer.abort_warming(generation)
+    assert not buffer.warming and not buffer.warm
+
+    generation = buffer.start_warming()
+    buffer.fill([message(1), message(2)], complete=True, generation=generation)
+    assert page_ids(buffer.get(None, None, 50)) == [1, 2]
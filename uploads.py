@@ -0,0 +1,312 @@
+from typing import Dict, Optional, Tuple
+import hashlib
+import os
+import re
+import secrets
+
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from fastapi.staticfiles import StaticFiles
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import MediaBlob
+
+UPLOAD_DIR = "uploads"
+# Временная папка внутри uploads, чтобы переименование в итоговую папку было атомарным
+UPLOAD_TMP_DIR = os.path.join(UPLOAD_DIR, "tmp")
+# Хранилище файлов по содержимому: uploads/media/<первые 2 символа хэша>/<sha256><расширение>
+MEDIA_DIR = "media"
+# Размер куска при копировании файла на диск
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Файлы в хранилище никогда не меняются, поэтому кэшируем их в браузере на год
+MEDIA_CACHE_MAX_AGE = 365 * 24 * 3600
+
+MB = 1024 * 1024
+
+# Ограничения размера по типу файла (в мегабайтах, можно переопределить через переменные окружения)
+UPLOAD_LIMITS = {
+    "avatar": int(os.getenv("UPLOAD_MAX_AVATAR_MB", "5")) * MB,
+    "image": int(os.getenv("UPLOAD_MAX_IMAGE_MB", "10")) * MB,
+    "video": int(os.getenv("UPLOAD_MAX_VIDEO_MB", "100")) * MB,
+    "audio": int(os.getenv("UPLOAD_MAX_AUDIO_MB", "20")) * MB,
+}
+
+# Допустимые типы медиа в чате
+CHAT_MEDIA_TYPES = ("image", "video", "audio")
+# Запас на остальные поля формы и заголовки частей multipart сверх размера файла
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+
+# Определяем тип медиа по content-type
+def detect_media_type(content_type: Optional[str]) -> Optional[str]:
+    content_type = content_type or ""
+    for media_type in CHAT_MEDIA_TYPES:
+        if content_type.startswith(f"{media_type}/"):
+            return media_type
+    return None
+
+
+def too_large_error(limit: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Файл слишком большой. Максимальный размер: {limit // MB} МБ"
+    )
+
+
+def url_to_path(url: str) -> str:
+    return url.lstrip("/")
+
+
+def media_url(sha256: str, ext: str) -> str:
+    return f"/{UPLOAD_DIR}/{MEDIA_DIR}/{sha256[:2]}/{sha256}{ext}"
+
+
+def is_media_url(url: Optional[str]) -> bool:
+    return bool(url) and url.startswith(f"/{UPLOAD_DIR}/{MEDIA_DIR}/")
+
+
+# Расширение из имени файла, только безопасные символы
+def safe_extension(filename: Optional[str]) -> str:
+    ext = os.path.splitext(filename or "")[1].lower()
+    return ext if re.fullmatch(r"\.[a-z0-9]{1,10}", ext) else ""
+
+
+def new_tmp_path() -> str:
+    return os.path.join(UPLOAD_TMP_DIR, f"{secrets.token_urlsafe(16)}.part")
+
+
+# Хэш уже записанного файла (для файлов, созданных на сервере, например миниатюр)
+def hash_file(path: str) -> Tuple[str, int]:
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+# Потоковый прием загруженного файла во временную папку с подсчетом хэша
+async def receive_upload(file: UploadFile, limit: int) -> Tuple[str, str, int]:
+    """Копирует файл кусками во временный файл, возвращает (путь, sha256, размер).
+
+    Файл ни разу не читается в память целиком; при превышении limit
+    запись прерывается с ошибкой 413.
+    """
+    # Тело запроса уже ограничено UploadLimitMiddleware по самому большому типу;
+    # здесь - точный предел для этого типа файла
+    if file.size is not None and file.size > limit:
+        raise too_large_error(limit)
+
+    await aiofiles.os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    tmp_path = new_tmp_path()
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        async with aiofiles.open(tmp_path, "wb") as buffer:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > limit:
+                    raise too_large_error(limit)
+                digest.update(chunk)
+                await buffer.write(chunk)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            await aiofiles.os.remove(tmp_path)
+        raise
+
+    return tmp_path, digest.hexdigest(), size
+
+
+async def _add_blob_ref(db: AsyncSession, url: str) -> bool:
+    result = await db.execute(
+        update(MediaBlob)
+        .where(MediaBlob.path == url)
+        .values(ref_count=MediaBlob.ref_count + 1)
+    )
+    return result.rowcount > 0
+
+
+# Перенос временного файла в хранилище с увеличением счетчика ссылок
+async def store_blob(db: AsyncSession, tmp_path: str, sha256: str, size: int, ext: str) -> str:
+    """Возвращает неизменяемый URL файла. Изменения в БД попадают в транзакцию db.
+
+    Если такой файл уже есть, временный удаляется - одинаковые загрузки
+    хранятся на диске один раз.
+    """
+    url = media_url(sha256, ext)
+
+    # Сначала ссылка в БД, потом файл: если параллельное удаление последней ссылки
+    # успело удалить строку, мы вставим новую и запишем файл заново
+    created = not await _add_blob_ref(db, url)
+    if created:
+        try:
+            async with db.begin_nested():
+                db.add(MediaBlob(path=url, sha256=sha256, size=size, ref_count=1))
+        except IntegrityError:
+            # Тот же файл одновременно загрузили дважды - строку вставил другой запрос
+            created = False
+            if not await _add_blob_ref(db, url):
+                raise
+
+    final_path = url_to_path(url)
+    if created or not os.path.exists(final_path):
+        # Для новой строки файл пишем всегда, не полагаясь на остатки от удаленной строки.
+        # Содержимое то же, replace атомарен
+        await aiofiles.os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        await aiofiles.os.replace(tmp_path, final_path)
+    else:
+        await aiofiles.os.remove(tmp_path)
+
+    return url
+
+
+# Прием загрузки и сохранение в хранилище по содержимому
+async def save_upload(db: AsyncSession, file: UploadFile, limit: int) -> Tuple[str, int]:
+    tmp_path, sha256, size = await receive_upload(file, limit)
+    try:
+        url = await store_blob(db, tmp_path, sha256, size, safe_extension(file.filename))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            await aiofiles.os.remove(tmp_path)
+        raise
+    return url, size
+
+
+# Освобождение ссылки на файл: сам файл удаляется, когда на него больше никто не ссылается
+async def release_upload(db: AsyncSession, url: Optional[str]):
+    """Вызывается после коммита основной транзакции, коммитит сама"""
+    if not url:
+        return
+
+    if is_media_url(url):
+        # Уменьшение и удаление - атомарные запросы, без чтения счетчика в Python:
+        # иначе параллельные освобождения и загрузки теряют обновления
+        result = await db.execute(
+            update(MediaBlob)
+            .where(MediaBlob.path == url)
+            .values(ref_count=MediaBlob.ref_count - 1)
+            .returning(MediaBlob.ref_count)
+        )
+        ref_count = result.scalar_one_or_none()
+        if ref_count is None or ref_count > 0:
+            await db.commit()
+            return
+        # Строку удаляет только тот, кто увидел ноль в момент DELETE: за это время
+        # параллельная загрузка могла снова увеличить счетчик
+        result = await db.execute(
+            delete(MediaBlob).where(MediaBlob.path == url, MediaBlob.ref_count <= 0)
+        )
+        # Файл удаляем до коммита, пока строка заблокирована (в SQLite - вся БД на запись):
+        # параллельный store_blob дождется коммита, не найдет строку и запишет файл заново.
+        # Удали мы файл после коммита - он мог бы стереть уже записанный заново файл
+        if result.rowcount > 0:
+            await _remove_file(url_to_path(url))
+        await db.commit()
+        return
+
+    # Старые аватарки лежат в uploads/avatars и принадлежат одному пользователю
+    if url.startswith(f"/{UPLOAD_DIR}/avatars/"):
+        await _remove_file(url_to_path(url))
+
+
+async def _remove_file(path: str):
+    if os.path.exists(path):
+        await aiofiles.os.remove(path)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadLimitMiddleware:
+    """ASGI-middleware: ограничение размера тела для маршрутов загрузки.
+
+    FastAPI разбирает multipart и сохраняет файл во временный файл до вызова
+    обработчика, поэтому проверка в receive_upload срабатывает, когда все уже
+    принято. Здесь запрос отклоняется сразу по Content-Length, а без него -
+    как только принятых байт становится больше limit + UPLOAD_FORM_OVERHEAD.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        max_body = limit + UPLOAD_FORM_OVERHEAD
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > max_body:
+                await self._reject(limit, scope, receive, send)
+                return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def receive_wrapper():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body:
+                    exceeded = True
+                    raise UploadTooLarge()
+            return message
+
+        async def send_wrapper(message):
+            nonlocal response_started
+            # FastAPI превращает ошибку разбора формы в 400 - вместо него отвечаем 413
+            if exceeded:
+                if message["type"] == "http.response.start" and not response_started:
+                    response_started = True
+                    await self._reject(limit, scope, receive, send)
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except UploadTooLarge:
+            if response_started:
+                raise
+            await self._reject(limit, scope, receive, send)
+
+    @staticmethod
+    async def _reject(limit: int, scope, receive, send):
+        error = too_large_error(limit)
+        # Остаток тела не читаем: сервер закроет соединение после ответа
+        response = JSONResponse(
+            {"detail": error.detail}, status_code=error.status_code, headers={"Connection": "close"}
+        )
+        await response(scope, receive, send)
+
+
+class CachedStaticFiles(StaticFiles):
+    """Раздача неизменяемых файлов с долгим кэшированием в браузере"""
+
+    def __init__(self, *args, max_age: int = MEDIA_CACHE_MAX_AGE, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_control = f"public, max-age={max_age}, immutable"
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = self.cache_control
+        return response